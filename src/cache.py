@@ -0,0 +1,141 @@
+# in-process and shared caches
+from collections import OrderedDict
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from redis import Redis, RedisError
+
+
+class LRUCache:
+    """bounded, thread safe least-recently-used cache with an optional ttl
+
+    a ttl of 0 means entries only leave the cache when they are evicted
+    or invalidated
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize < 1:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                size=len(self._data),
+                maxsize=self.maxsize,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+
+class SharedCache:
+    """cache tier shared by all workers, backed by redis
+
+    keys carry a version so a change to what is cached can be rolled out by
+    bumping it instead of flushing redis. redis errors are logged and treated
+    as a miss so the cache can never take the site down
+
+    every entry also has a change count (its ver: key) that invalidate bumps.
+    get hands the count out with a miss and set stores the value under it, so
+    a value read from storage before a write but set after the write's
+    invalidation is never served
+    """
+
+    def __init__(self, url: str, ttl: int = 300, prefix: str = "cache", version: int = 1):
+        self.redis = Redis.from_url(url)
+        self.ttl = ttl
+        # outlives any value set under a count from before the last bump
+        self.version_ttl = 2 * ttl
+        self.prefix = f"{prefix}:v{version}"
+
+    def _key(self, kind: str, path: str) -> str:
+        return f"{self.prefix}:{kind}:{path}"
+
+    def _version_key(self, kind: str, path: str) -> str:
+        return f"{self.prefix}:ver:{kind}:{path}"
+
+    def get(self, kind: str, path: str) -> Tuple[Optional[Any], Optional[int]]:
+        """(the cached value or None, the change count to set a value read now under)"""
+        try:
+            raw, version = self.redis.mget(
+                self._key(kind, path), self._version_key(kind, path)
+            )
+        except RedisError as exp:
+            logging.error(f"Could not read {kind} {path} from shared cache - {exp}")
+            return None, None
+        version = int(version or 0)
+        if raw is None:
+            return None, version
+        entry = json.loads(raw)
+        if not isinstance(entry, dict) or entry.get("v") != version:
+            # set before the entry last changed
+            return None, version
+        return entry["value"], version
+
+    def set(self, kind: str, path: str, value: Any, version: Optional[int]):
+        if version is None:
+            # the count couldn't be read, the value may already be stale
+            return
+        try:
+            self.redis.set(
+                self._key(kind, path),
+                json.dumps(dict(v=version, value=value)),
+                ex=self.ttl,
+            )
+        except RedisError as exp:
+            logging.error(f"Could not write {kind} {path} to shared cache - {exp}")
+
+    def invalidate(self, *entries: Tuple[str, str]):
+        if not entries:
+            return
+        try:
+            with self.redis.pipeline() as pipe:
+                for kind, path in entries:
+                    pipe.incr(self._version_key(kind, path))
+                    pipe.expire(self._version_key(kind, path), self.version_ttl)
+                pipe.delete(*[self._key(kind, path) for kind, path in entries])
+                pipe.execute()
+        except RedisError as exp:
+            logging.error(f"Could not invalidate shared cache entries - {exp}")
@@ -7,6 +7,10 @@ class Config(BaseModel):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "super-secret-key")
     WEEDFS_FILER_URL: str = os.getenv("WEEDFS_FILER_URL", "")
     WEEDFS_BASE_FOLDER: str = os.getenv("WEEDFS_BASE_FOLDER", "/myfundquest")
+    WEEDFS_POOL_SIZE: int = int(os.getenv("WEEDFS_POOL_SIZE", 10))
+    WEEDFS_MAX_RETRIES: int = int(os.getenv("WEEDFS_MAX_RETRIES", 3))
+    WEEDFS_BACKOFF_FACTOR: float = float(os.getenv("WEEDFS_BACKOFF_FACTOR", 0.1))
+    WEEDFS_TIMEOUT_SECONDS: float = float(os.getenv("WEEDFS_TIMEOUT_SECONDS", 10))
     LOCAL_BASE_FOLDER: str = os.getenv("LOCAL_BASE_FOLDER", "data")
     FILE_SYSTEM_TYPE: str = os.getenv("FILE_SYSTEM_TYPE", "localfs")
     DEFAULT_RANDOM_TEXT_LENGTH: int = int(os.getenv("DEFAULT_RANDOM_TEXT_LENGTH", 32))
@@ -54,11 +58,65 @@ class Config(BaseModel):
         "MESSAGE_BANK_DATA",
         os.path.join(os.path.dirname(__file__), "support", "message_bank.json"),
     )
+    STOPWORDS_DATA: str = os.getenv(
+        "STOPWORDS_DATA",
+        os.path.join(os.path.dirname(__file__), "support", "stopwords.json"),
+    )
     ANONYMOUS_POST_PERCENT: float = float(os.getenv("ANONYMOUS_POST_PERCENT", 0.2))
     MESSAGE_POST_PERCENT: float = float(os.getenv("MESSAGE_POST_PERCENT", 0.3))
+    CAMPAIGN_CACHE_SIZE: int = int(os.getenv("CAMPAIGN_CACHE_SIZE", 1024))
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", 1024))
+    # bounds how stale an entry can get when another worker updates it
+    MODEL_CACHE_TTL_SECONDS: float = float(os.getenv("MODEL_CACHE_TTL_SECONDS", 30))
+    ENABLE_SHARED_CACHE: bool = (
+        os.getenv("ENABLE_SHARED_CACHE", "FALSE").upper() == "TRUE"
+    )
+    SHARED_CACHE_URL: str = os.getenv("SHARED_CACHE_URL", "redis://localhost:6379/2")
+    SHARED_CACHE_TTL_SECONDS: int = int(os.getenv("SHARED_CACHE_TTL_SECONDS", 300))
+    SHARED_CACHE_VERSION: int = int(os.getenv("SHARED_CACHE_VERSION", 1))
+    RETRIEVE_MAX_WORKERS: int = int(os.getenv("RETRIEVE_MAX_WORKERS", 16))
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+    INDEX_WRITE_MAX_WORKERS: int = int(os.getenv("INDEX_WRITE_MAX_WORKERS", 8))
     MAX_LATEST_COUNT: int = int(os.getenv("MAX_LATEST_COUNT", 100))
+    LATEST_PAGE_SIZE: int = int(os.getenv("LATEST_PAGE_SIZE", 25))
+    CATEGORY_FEED_SIZE: int = int(os.getenv("CATEGORY_FEED_SIZE", 1000))
+    CATEGORY_PAGE_SIZE: int = int(os.getenv("CATEGORY_PAGE_SIZE", 25))
+    # codec stored documents are written with: json, orjson or msgpack (the
+    # latter two need the package installed), reads detect the codec
+    DOCUMENT_CODEC: str = os.getenv("DOCUMENT_CODEC", "json").lower()
+    # image variants are immutable (content addressed), browsers may keep them
+    IMAGE_CACHE_MAX_AGE_SECONDS: int = int(
+        os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", 365 * 24 * 3600)
+    )
+    CONTRIBUTION_RING_SIZE: int = int(os.getenv("CONTRIBUTION_RING_SIZE", 100))
+    REINDEX_BATCH_SIZE: int = int(os.getenv("REINDEX_BATCH_SIZE", 100))
+    # a reindex merges the word index in this many independent jobs
+    REINDEX_WORD_BUCKETS: int = int(os.getenv("REINDEX_WORD_BUCKETS", 32))
+    # how long a process may keep serving/writing a replaced index generation
+    INDEX_GENERATION_TTL_SECONDS: float = float(
+        os.getenv("INDEX_GENERATION_TTL_SECONDS", 10)
+    )
+    LEADERBOARD_SIZE: int = int(os.getenv("LEADERBOARD_SIZE", 100))
+    # "file" keeps feeds/leaderboards as documents in the file system, "redis" in sorted sets
+    FEED_BACKEND: str = os.getenv("FEED_BACKEND", "file").lower()
+    FEED_REDIS_URL: str = os.getenv("FEED_REDIS_URL", "redis://localhost:6379/3")
+    # "file" flocks lock files (local fs only), "redis" takes SET NX leases.
+    # unset picks file for localfs and redis for weedfs
+    LOCK_BACKEND: str = os.getenv("LOCK_BACKEND", "").lower()
+    LOCK_REDIS_URL: str = os.getenv("LOCK_REDIS_URL", "redis://localhost:6379/4")
+    LOCK_TIMEOUT_SECONDS: float = float(os.getenv("LOCK_TIMEOUT_SECONDS", 10))
+    # how long a crashed holder can block a redis lock, far above any hold
+    LOCK_LEASE_MS: int = int(os.getenv("LOCK_LEASE_MS", 30000))
     SENTIMENT_URL: str = os.getenv("SENTIMENT_URL", "")
 
+    # when false, contributions are only simulated by the celery beat task
+    # (tasks.advance_contributions) and page views are pure reads
+    SIMULATE_CONTRIBUTIONS_ON_READ: bool = (
+        os.getenv("SIMULATE_CONTRIBUTIONS_ON_READ", "TRUE").upper() == "TRUE"
+    )
+    SIMULATION_INTERVAL_SECONDS: int = int(os.getenv("SIMULATION_INTERVAL_SECONDS", 300))
+    SIMULATION_BATCH_SIZE: int = int(os.getenv("SIMULATION_BATCH_SIZE", 100))
+
     # algorithm: see readme
     DIVISOR_UPDATES_PER_TIME_PERIOD: int = max(
         1, int(os.getenv("NUMBER_UPDATES_PER_TIME_PERIOD", 1000))
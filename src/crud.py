@@ -1,14 +1,30 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from hashlib import md5
 from io import BytesIO, StringIO
 import json
-from typing import Any, Dict, List, Tuple, Union
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+from cache import LRUCache
 from config import config
 from data_manager import get_data_manager, sep, ListPathException, LoadOjbectException
 from models import User, Campaign
-from indexing import IndexManager
-from utils import gen_random, resize_and_center_crop
+import images
+from reference_data import reference_data
+from indexing import IndexManager, IndexWriteBatch, UserCampaignIndex
 
 datamgr = get_data_manager()
+# bounded pool shared by the bulk retrieval apis
+retrieve_pool = ThreadPoolExecutor(
+    max_workers=config.RETRIEVE_MAX_WORKERS, thread_name_prefix="retrieve"
+)
+# hot object caches. models are mutable so copies go in and come out
+campaign_cache = LRUCache(
+    maxsize=config.CAMPAIGN_CACHE_SIZE, ttl=config.MODEL_CACHE_TTL_SECONDS
+)
+user_cache = LRUCache(maxsize=config.USER_CACHE_SIZE, ttl=config.MODEL_CACHE_TTL_SECONDS)
 
 
 class RecordExistsException(Exception):
@@ -50,7 +66,7 @@ class NoCategoryExistsException(Exception):
 class Crud:
     @classmethod
     def load_country_currency_data(cls):
-        return json.load(open(config.COUNTRY_CURRENCY_DATA))
+        return reference_data.get("country_currency")
 
     @classmethod
     def retrieve_countries(cls):
@@ -62,73 +78,72 @@ class Crud:
     def retrieve_country_currency(cls, country_id: int):
         if not isinstance(country_id, int):
             country_id = int(country_id)
-        cc = next(
-            (x for x in cls.load_country_currency_data() if x.get("id") == country_id),
-            None,
-        )
-        return cc
+        return reference_data.by_id("country_currency", country_id)
 
     @classmethod
     def retreive_categories(cls):
-        return json.load(open(config.CATEGORIES_DATA))
+        return reference_data.get("categories")
 
     @classmethod
     def retreive_donation_distribution(cls):
-        return json.load(open(config.DONATION_DISTRIBUTION_DATA))
+        return reference_data.get("donation_distribution")
 
     @classmethod
     def retrieve_first_names(cls):
-        return json.load(open(config.FIRST_NAMES_DATA))
+        return reference_data.get("first_names")
 
     @classmethod
     def retrieve_message_bank(cls):
-        return json.load(open(config.MESSAGE_BANK_DATA))
+        return reference_data.get("message_bank")
 
     @classmethod
     def retrieve_category_name(cls, category_id: int) -> str:
         if not isinstance(category_id, int):
             category_id = int(category_id)
-        category = next(
-            (x for x in cls.retreive_categories() if x.get("id") == category_id), None
-        )
+        category = reference_data.by_id("categories", category_id)
         if category is None:
             raise NoCategoryExistsException(f"No category with id {category_id} found")
         return category["name"]
 
     @classmethod
     def retreive_campaign_types(cls):
-        return json.load(open(config.CAMPAIGN_TYPES_DATA))
+        return reference_data.get("campaign_types")
 
     @classmethod
     def retreive_campaign_type_name(cls, campaign_type_id: int) -> str:
-        campaign_type = next(
-            (
-                x
-                for x in cls.retreive_campaign_types()
-                if x.get("id") == campaign_type_id
-            ),
-            None,
-        )
+        campaign_type = reference_data.by_id("campaign_types", campaign_type_id)
         if campaign_type is None:
             raise NoCampaignTypeExistsException(
                 f"No campaign type with id {campaign_type_id} found"
             )
         return campaign_type["name"]
 
+    @classmethod
+    def reload_reference_data(cls, name: str = ""):
+        reference_data.reload(name)
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Dict[str, int]]:
+        return dict(campaign=campaign_cache.stats(), user=user_cache.stats())
+
     # ######
     # user
     # ######
     @classmethod
     def update_user(cls, user: User):
         datamgr.save(user)
+        user_cache.set(user.id, user.copy(deep=True))
         IndexManager.update_user_indicies(user)
 
     @classmethod
     def retrieve_user(cls, user_id: str) -> User:
-        path = User.build_path(oid=user_id)
-        if not datamgr.exists(path):
-            return None
-        return User(**json.load(datamgr.get(path=path)))
+        user = user_cache.get(user_id)
+        if user is None:
+            user = datamgr.load_or_none(User.build_path(oid=user_id), model_type=User)
+            if user is None:
+                return None
+            user_cache.set(user_id, user)
+        return user.copy(deep=True)
 
     # ########
     # campaign
@@ -136,47 +151,213 @@ class Crud:
     @classmethod
     def update_campaign(cls, campaign: Campaign, img: Any = None):
         path = campaign.get_relative_path()
-        update_indicies = True
-        if datamgr.exists(path=path):
-            # delete existing word index if necessary
-            update_indicies = False
-            old_campaign_data = json.load(datamgr.get(path=path))
-            old_words = set(
-                (
-                    old_campaign_data.get("title")
-                    + old_campaign_data.get("description")
-                ).split()
-            )
-            new_words = set((campaign.title + campaign.description).split())
-            diff = old_words - new_words
-            if diff:
-                update_indicies = True
-                for word in diff:
-                    IndexManager.delete_word_campaign_id(
-                        word=word, campaign_id=campaign.id
-                    )
-            campaign.created = old_campaign_data.get("created")
+        index_digest = IndexManager.campaign_index_digest(campaign)
+        # saves that don't touch indexed fields (eg: contributions) do no index io
+        update_indicies = campaign.index_digest != index_digest
+        leaderboard_key = IndexManager.campaign_leaderboard_key(campaign)
+        previous_leaderboard_key = campaign.leaderboard_key
+        update_leaderboards = previous_leaderboard_key != leaderboard_key
+        old_campaign_data = None
+        if update_indicies:
+            # what the index entries were built from, not a stale cached copy
+            old_campaign_data = datamgr.read_document_or_none(path, use_cache=False)
+            if old_campaign_data is not None:
+                campaign.created = old_campaign_data.get("created")
 
         if img:
-            _img = resize_and_center_crop(img, (650, 450))
-            img_path = sep.join([campaign.get_parent_path(), f"{gen_random(32)}.png"])
-            datamgr.put(path=img_path, obj=_img)
-            campaign.image_path = img_path
+            # the sized variants are rendered by tasks.generate_image_variants
+            campaign.image_hash = images.store_original(img)
+
+        campaign.index_digest = index_digest
+        campaign.leaderboard_key = leaderboard_key
+        # the content only changes on edits, contributions just rewrite the state
+        content = campaign.content_dict()
+        content_digest = cls.campaign_content_digest(content)
+        if campaign.content_digest != content_digest:
+            campaign.content_digest = content_digest
+            content["content_digest"] = content_digest
+            datamgr.write_document(path, content)
+        datamgr.write_document(
+            Campaign.build_state_path(campaign.id), campaign.state_dict()
+        )
+        campaign_cache.set(campaign.id, campaign.copy(deep=True))
+        if not update_indicies and not update_leaderboards:
+            return
+
+        with IndexWriteBatch() as batch:
+            if update_leaderboards:
+                IndexManager.update_campaign_leaderboards(
+                    campaign, batch=batch, previous_key=previous_leaderboard_key
+                )
+            if not update_indicies:
+                return
+            if old_campaign_data:
+                # drop index entries the new version no longer has
+                old_campaign = Campaign.from_storage(old_campaign_data)
+                batch.remove_words(
+                    campaign.id,
+                    set(IndexManager.campaign_words(old_campaign))
+                    - set(IndexManager.campaign_words(campaign)),
+                )
+                if old_campaign.user_id != campaign.user_id:
+                    batch.delete(
+                        UserCampaignIndex.build_path(
+                            ref_id=old_campaign.user_id, target_id=campaign.id
+                        )
+                    )
+                if old_campaign.category_id != campaign.category_id:
+                    batch.remove_category(old_campaign.category_id, campaign.id)
+            IndexManager.update_campaign_indicies(campaign, batch=batch)
 
-        datamgr.save(campaign)
-        if update_indicies:
-            print("updating indicies")
-            IndexManager.update_campaign_indicies(campaign)
+    @classmethod
+    def campaign_content_digest(cls, content: Dict[str, Any]) -> str:
+        return md5(
+            json.dumps(
+                {x: y for x, y in content.items() if x != "content_digest"},
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
 
     @classmethod
-    def retrieve_campaign(cls, campaign_id: str) -> Campaign:
-        path = Campaign.build_path(oid=campaign_id)
-        if not datamgr.exists(path):
-            return None
-        campaign_data = json.load(datamgr.get(path=path))
-        campaign = Campaign(**campaign_data)
-        campaign.created = campaign_data.get("created")
-        return campaign
+    def campaign_paths(cls, campaign_id: str) -> List[str]:
+        # content first, the state overrides it (legacy data.json has both)
+        return [
+            Campaign.build_path(oid=campaign_id),
+            Campaign.build_state_path(oid=campaign_id),
+        ]
+
+    @classmethod
+    def retrieve_campaign(cls, campaign_id: str, use_cache: bool = True) -> Campaign:
+        """the campaign, use_cache=False reads past the caches (for writers)"""
+        campaign = campaign_cache.get(campaign_id) if use_cache else None
+        if campaign is None:
+            campaign = datamgr.load_composed_or_none(
+                cls.campaign_paths(campaign_id),
+                model_type=Campaign,
+                use_cache=use_cache,
+            )
+            if campaign is None:
+                return None
+            campaign_cache.set(campaign_id, campaign)
+        return campaign.copy(deep=True)
+
+    @classmethod
+    @contextmanager
+    def campaign_for_update(cls, campaign_id: str) -> Iterator[Optional[Campaign]]:
+        """the stored campaign, read past the caches, with its other writers locked out
+
+        None once the campaign is deleted, callers must check
+
+            with Crud.campaign_for_update(campaign_id) as campaign:
+                if campaign is None:
+                    return
+                campaign.sentiment = "positive"
+                Crud.update_campaign(campaign)
+        """
+        with datamgr.lock(Campaign.build_state_path(campaign_id)):
+            yield cls.retrieve_campaign(campaign_id, use_cache=False)
+
+    @classmethod
+    async def aretrieve_campaign(
+        cls, campaign_id: str, use_cache: bool = True
+    ) -> Campaign:
+        # see retrieve_campaign
+        campaign = campaign_cache.get(campaign_id) if use_cache else None
+        if campaign is None:
+            campaign = await datamgr.aload_composed_or_none(
+                cls.campaign_paths(campaign_id),
+                model_type=Campaign,
+                use_cache=use_cache,
+            )
+            if campaign is None:
+                return None
+            campaign_cache.set(campaign_id, campaign)
+        return campaign.copy(deep=True)
+
+    @classmethod
+    async def aretrieve_campaigns(
+        cls, campaign_ids: List[str], use_cache: bool = True
+    ) -> List[Campaign]:
+        # fetches concurrently, results are in the same order as campaign_ids
+        return await asyncio.gather(
+            *[
+                cls.aretrieve_campaign(campaign_id=x, use_cache=use_cache)
+                for x in campaign_ids
+            ]
+        )
+
+    @classmethod
+    def retrieve_campaigns(
+        cls, campaign_ids: List[str], use_cache: bool = True
+    ) -> Tuple[List[Campaign], List[str]]:
+        """returns the campaigns (in the order of campaign_ids) and the missing ids
+
+        the documents are read concurrently on the event loop of the data
+        manager when it has an async file system, else over retrieve_pool
+        """
+
+        def _load(campaign_id: str) -> Campaign:
+            try:
+                return cls.retrieve_campaign(
+                    campaign_id=campaign_id, use_cache=use_cache
+                )
+            except LoadOjbectException as exp:
+                logging.error(f"Could not load campaign {campaign_id} - {exp}")
+                return None
+
+        async def _aload(campaign_id: str) -> Campaign:
+            try:
+                return await cls.aretrieve_campaign(
+                    campaign_id=campaign_id, use_cache=use_cache
+                )
+            except LoadOjbectException as exp:
+                logging.error(f"Could not load campaign {campaign_id} - {exp}")
+                return None
+
+        async def _aload_all() -> List[Campaign]:
+            return await asyncio.gather(*[_aload(x) for x in campaign_ids])
+
+        if datamgr.afs:
+            loaded = datamgr.run(_aload_all())
+        else:
+            loaded = retrieve_pool.map(_load, campaign_ids)
+
+        campaigns = []
+        missing_ids = []
+        for campaign_id, campaign in zip(campaign_ids, loaded):
+            if campaign is None:
+                missing_ids.append(campaign_id)
+            else:
+                campaigns.append(campaign)
+        if missing_ids:
+            logging.warning(f"Could not retrieve campaigns {missing_ids}")
+        return campaigns, missing_ids
+
+    @classmethod
+    def iter_campaign_partitions(cls, after: str = "") -> Iterator[Tuple[str, List[str]]]:
+        """streams (partition, campaign ids) in sorted partition order
+
+        partitions are "xx/xxx" keys, only those sorting after `after` are
+        walked so a caller can resume from the last partition it finished
+        """
+
+        def _ls(path: str) -> List[str]:
+            try:
+                # skip hidden entries like the weedfs .info directory marker
+                return sorted([x for x in datamgr.ls(path) if not x.startswith(".")])
+            except ListPathException:
+                return []
+
+        root = Campaign.__name__
+        for level1 in _ls(root):
+            if after and level1 < after.split(sep)[0]:
+                continue
+            for level2 in _ls(sep.join([root, level1])):
+                partition = sep.join([level1, level2])
+                if after and partition <= after:
+                    continue
+                yield partition, _ls(sep.join([root, level1, level2]))
 
     @classmethod
     def delete_campaign(cls, campaign_id: str):
@@ -184,9 +365,12 @@ class Crud:
         campaign = cls.retrieve_campaign(campaign_id=campaign_id)
         IndexManager.delete_campaign_indicies(campaign)
         datamgr.rm(path=path)
+        datamgr.rm_if_exists(path=Campaign.build_state_path(oid=campaign_id))
+        campaign_cache.invalidate(campaign_id)
 
     @classmethod
     def retrieve_image(cls, path: str) -> BytesIO:
-        if not datamgr.exists(path):
+        img = datamgr.get_or_none(path)
+        if img is None:
             raise DoesNotExistException()
-        return datamgr.get(path)
+        return img
@@ -1,18 +1,28 @@
-import inspect
-from io import BytesIO, StringIO
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+from io import BytesIO
 import mimetypes
 import logging
 import os
-import json
+import threading
 import time
-from typing import Any, Dict, List, Type, TypeVar
+from typing import Any, Awaitable, Dict, List, Optional, Type, TypeVar
 
-import arrow
 from pydantic import BaseModel
+from redis import Redis
 
+from cache import SharedCache
 from config import config
-from file_systems import FileSystem, LocalFileSystem, WeedFileSystem
+from file_systems import (
+    AsyncFileSystem,
+    AsyncWeedFileSystem,
+    FileSystem,
+    LocalFileSystem,
+    WeedFileSystem,
+)
 import models
+import serialization
 from utils import gen_random
 
 from file_systems.weed import ListPathExceptionWeed
@@ -22,6 +32,12 @@ from file_systems.local import ListPathExceptionLocal
 T = TypeVar("T", bound=BaseModel)
 sep = config.PATH_SEPERATOR
 
+# reads the documents of a composed model concurrently, separate from any
+# pool the caller may already be running in
+compose_pool = ThreadPoolExecutor(
+    max_workers=config.RETRIEVE_MAX_WORKERS, thread_name_prefix="compose"
+)
+
 
 class NotFound(Exception):
     pass
@@ -39,110 +55,365 @@ class LoadOjbectException(Exception):
     pass
 
 
+class LockTimeoutException(Exception):
+    pass
+
+
 class EntryLock:
-    def __init__(self, path: str, fs: FileSystem, timeout: int = 1):
-        # timeout in seconds
-        self.path = path + ".lock"
+    """context manager serializing the writers of a path across threads and processes
+
+    acquiring waits up to timeout seconds and raises LockTimeoutException, a
+    lock is never broken while its holder may still be writing
+    """
+
+    def __init__(self, path: str, timeout: float = config.LOCK_TIMEOUT_SECONDS):
+        self.path = path
         self.timeout = timeout
-        self.fs = fs
+
+    def acquire(self) -> bool:
+        # one non-blocking attempt, True if the lock is now held
+        raise NotImplementedError()
+
+    def release(self):
+        raise NotImplementedError()
 
     def __enter__(self):
-        # see if we need to cleanup hung lock
-        info = self.fs.info(self.path)
-        while info:
-            modified = info.get("Last-Modified", None)
-            if not modified:
-                self.fs.rm(self.path)
-                break
-            else:
-                if (
-                    arrow.utcnow()
-                    - arrow.get(modified, "ddd, DD MMM YYYY HH:mm:ss ZZZ")
-                ).seconds > self.timeout:
-                    self.fs.rm(self.path)
-                    break
-            time.sleep(1)
-
-        self.fs.put(self.path, obj=StringIO(""), ttl="1m")
-        # ^^ min ttl is 1m so create with ttl to guarentee removal
+        deadline = time.monotonic() + self.timeout
+        while not self.acquire():
+            if time.monotonic() >= deadline:
+                raise LockTimeoutException(
+                    f"Could not lock {self.path} within {self.timeout}s"
+                )
+            time.sleep(0.01)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.fs.exists(self.path):
-            self.fs.rm(self.path)
+        self.release()
+
+
+class FileEntryLock(EntryLock):
+    """flock on a lock file next to path (local file system only)
+
+    the kernel releases the lock when its holder exits, so a crashed writer
+    can't leave it held
+    """
+
+    def __init__(self, path: str, timeout: float = config.LOCK_TIMEOUT_SECONDS):
+        super().__init__(path, timeout=timeout)
+        self.fd = None
+
+    def acquire(self) -> bool:
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        # the lock file is left in place, removing it would let a waiter lock
+        # an unlinked file while a new one is created next to it
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+class RedisEntryLock(EntryLock):
+    """redis SET NX PX holding a random owner token
+
+    the lease bounds how long a crashed writer blocks the path, the release is a
+    compare-and-delete so a writer whose lease ran out can't drop the lock of
+    the next holder
+    """
+
+    release_script = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        path: str,
+        redis: Redis,
+        timeout: float = config.LOCK_TIMEOUT_SECONDS,
+        lease_ms: int = config.LOCK_LEASE_MS,
+    ):
+        super().__init__(path, timeout=timeout)
+        self.redis = redis
+        self.lease_ms = lease_ms
+        self.key = f"lock:{path}"
+        self.token = gen_random()
+
+    def acquire(self) -> bool:
+        return bool(self.redis.set(self.key, self.token, nx=True, px=self.lease_ms))
+
+    def release(self):
+        self.redis.eval(self.release_script, 1, self.key, self.token)
 
 
 class DataManager:
-    def __init__(self, file_system: FileSystem, base_folder: str):
+    def __init__(
+        self,
+        file_system: FileSystem,
+        base_folder: str,
+        async_file_system: Optional[AsyncFileSystem] = None,
+        shared_cache: Optional[SharedCache] = None,
+        lock_redis: Optional[Redis] = None,
+    ):
         self.fs = file_system
+        # locks live in redis when given, else they are flocks (local fs only)
+        self.lock_redis = lock_redis
+        # optional cache of documents and listings shared between workers
+        self.shared_cache = shared_cache
+        # when there is no native async file system the a* methods run the
+        # blocking calls in the default executor
+        self.afs = async_file_system
         self.base_folder = base_folder
         self.fs.mkdir(self.base_folder)
 
+    def scoped(self, folder: str) -> "DataManager":
+        """a data manager rooted at folder (relative to this one's base folder)
+
+        it shares the file systems, cache and locks of this one
+        """
+        return DataManager(
+            self.fs,
+            sep.join([self.base_folder, folder]),
+            async_file_system=self.afs,
+            shared_cache=self.shared_cache,
+            lock_redis=self.lock_redis,
+        )
+
     def _get_full_path(self, path: str) -> str:
         base_folder = self.base_folder
         if not path.startswith(base_folder):
             return sep.join([base_folder, path])
         return path
 
-    def save(self, obj: T) -> bool:
-        parent_path = self._get_full_path(obj.get_parent_path())
-        if not self.exists(path=parent_path):
-            self.mkdir(path=parent_path)
-        self.fs.put(
-            path=self._get_full_path(obj.get_relative_path()),
-            obj=json.dumps(obj.dict(), indent=4, default=str),
-            ttl=obj.get_ttl(),
+    def _invalidate(self, full_path: str):
+        # drops the cached document, its listing (if a dir) and the listing of
+        # every ancestor, a write creates the parents it is missing
+        if not self.shared_cache:
+            return
+        paths = [full_path]
+        while paths[-1] != self.base_folder and sep in paths[-1]:
+            paths.append(sep.join(paths[-1].split(sep)[0:-1]))
+        self.shared_cache.invalidate(
+            ("data", full_path), *[("ls", x) for x in paths if x]
         )
+
+    def _read_data_or_none(
+        self, full_path: str, use_cache: bool = True
+    ) -> Optional[Any]:
+        # the decoded document at full_path (whichever codec wrote it)
+        version = None
+        if use_cache and self.shared_cache:
+            data, version = self.shared_cache.get("data", full_path)
+            if data is not None:
+                return data
+        raw = self.fs.get_bytes_or_none(full_path)
+        if raw is None:
+            return None
+        data = serialization.decode(raw)
+        if use_cache and self.shared_cache:
+            self.shared_cache.set("data", full_path, data, version)
+        return data
+
+    def save(self, obj: T) -> bool:
+        # mkdir is idempotent so there is no need to check for the parent first
+        self.mkdir(path=self._get_full_path(obj.get_parent_path()))
+        # every document of a model stored split across several (eg: Campaign)
+        for path, data in obj.documents().items():
+            full_path = self._get_full_path(path)
+            self.fs.put(
+                path=full_path,
+                obj=serialization.encode(data),
+                ttl=obj.get_ttl(),
+            )
+            self._invalidate(full_path)
         return True
 
     def put(self, path: str, obj: Any, ttl: str = "", with_lock: bool = False) -> bool:
         # puts any object into fs
         if with_lock:
-            with EntryLock(path, self.fs) as lock:
+            with self.lock(path):
                 self.fs.put(path=self._get_full_path(path), obj=obj, ttl=ttl)
         else:
             self.fs.put(path=self._get_full_path(path), obj=obj, ttl=ttl)
+        self._invalidate(self._get_full_path(path))
         return True
 
     def ls(self, path: str) -> List[str]:
         full_path = self._get_full_path(path)
+        version = None
+        if self.shared_cache:
+            entries, version = self.shared_cache.get("ls", full_path)
+            if entries is not None:
+                return entries
         try:
-            return self.fs.ls(path=full_path)
+            entries = self.fs.ls(path=full_path)
         except ListPathExceptionLocal as exp:
             raise ListPathException(exp)
         except ListPathExceptionWeed as exp:
             raise ListPathException(exp)
+        if self.shared_cache:
+            self.shared_cache.set("ls", full_path, entries, version)
+        return entries
 
     def loaddir(self, path: str, model_type: Type[T] = None) -> List[Any]:
-        res = []
-        for entry in [sep.join([path, x]) for x in self.ls(path)]:
-            res.append(self.load(sep.join([entry, "data.json"]), model_type=model_type))
-        return res
+        """the model of every entry under path, entries without a data.json are skipped
+
+        models stored split across documents (eg: Campaign) are composed from
+        all of them, as load_composed_or_none does
+        """
+        res = compose_pool.map(
+            lambda x: self._load_entry_or_none(sep.join([path, x]), model_type),
+            self.ls(path),
+        )
+        return [x for x in res if x is not None]
+
+    def _load_entry_or_none(self, path: str, model_type: Type[T] = None) -> Optional[T]:
+        # read in turn, this already runs on compose_pool
+        full_path = self._get_full_path(path)
+        try:
+            docs = [self._read_data_or_none(sep.join([full_path, "data.json"]))]
+            if docs[0] is None:
+                return None
+            if not model_type:
+                model_type = models.get_model_type(docs[0].get("model_name", ""))
+            filenames = getattr(model_type, "document_filenames", ["data.json"])
+            docs.extend(
+                self._read_data_or_none(sep.join([full_path, x])) for x in filenames[1:]
+            )
+            data = self._compose(docs)
+        except Exception as exp:
+            raise LoadOjbectException(f"Could not load data at {path} (exp: {exp})")
+        return self._to_model(data, model_type=model_type)
+
+    def load_many(
+        self, paths: List[str], model_type: Type[T] = None
+    ) -> List[Optional[T]]:
+        """loads the models at paths concurrently (in order), None if nothing is stored"""
+        return list(
+            compose_pool.map(
+                lambda x: self.load_or_none(x, model_type=model_type), paths
+            )
+        )
 
     def get(self, path: str) -> Any:  # file like object
         _path = self._get_full_path(path)
         return self.fs.get(_path)
 
-    def load(self, path: str, model_type: Type[T] = None) -> T:
-        # loads the data as an object
+    def get_or_none(self, path: str) -> Any:  # file like object or None
+        return self.fs.get_or_none(self._get_full_path(path))
+
+    def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        return self.fs.get_bytes_or_none(self._get_full_path(path))
+
+    def load_or_none(self, path: str, model_type: Type[T] = None) -> Optional[T]:
+        # loads the data as an object, None if nothing is stored at path
+        try:
+            data = self._read_data_or_none(self._get_full_path(path))
+            if data is None:
+                return None
+        except Exception as exp:
+            raise LoadOjbectException(f"Could not load data at {path} (exp: {exp})")
+        return self._to_model(data, model_type=model_type)
+
+    def load_composed_or_none(
+        self, paths: List[str], model_type: Type[T] = None, use_cache: bool = True
+    ) -> Optional[T]:
+        """loads a model stored split across documents (read concurrently)
+
+        fields of later documents override earlier ones. None if the first
+        document is missing, the others are optional
+        """
         try:
-            data = json.load(self.fs.get(self._get_full_path(path)))
+            docs = list(
+                compose_pool.map(
+                    lambda x: self._read_data_or_none(x, use_cache=use_cache),
+                    [self._get_full_path(x) for x in paths],
+                )
+            )
+            data = self._compose(docs)
+        except Exception as exp:
+            raise LoadOjbectException(f"Could not load data at {paths} (exp: {exp})")
+        return None if data is None else self._to_model(data, model_type=model_type)
+
+    @staticmethod
+    def _compose(docs: List[Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        if docs[0] is None:
+            return None
+        data = {}
+        for doc in docs:
+            if doc is not None:
+                data.update(doc)
+        return data
+
+    def read_document_or_none(self, path: str, use_cache: bool = True) -> Optional[Any]:
+        """reads a plain document (not a model), None if nothing is at path
+
+        read-modify-write callers must pass use_cache=False
+        """
+        try:
+            return self._read_data_or_none(
+                self._get_full_path(path), use_cache=use_cache
+            )
         except Exception as exp:
             raise LoadOjbectException(f"Could not load data at {path} (exp: {exp})")
-        res = None
+
+    def write_document(self, path: str, data: Any) -> bool:
+        # encoded with the configured codec (see serialization.py)
+        _path = self._get_full_path(path)
+        self.mkdir(sep.join(_path.split(sep)[0:-1]))
+        return self.put(path=_path, obj=serialization.encode(data))
+
+    def lock(
+        self,
+        path: str,
+        timeout: float = config.LOCK_TIMEOUT_SECONDS,
+        lease_ms: int = config.LOCK_LEASE_MS,
+    ) -> EntryLock:
+        """context manager serializing writers of path across processes
+
+        lease_ms only applies to redis locks, a flock is held until released
+        """
+        _path = self._get_full_path(path)
+        if self.lock_redis is not None:
+            return RedisEntryLock(
+                _path, self.lock_redis, timeout=timeout, lease_ms=lease_ms
+            )
+        if not isinstance(self.fs, LocalFileSystem):
+            raise ValueError(
+                f"Locking on {type(self.fs).__name__} needs LOCK_BACKEND=redis"
+            )
+        self.mkdir(sep.join(_path.split(sep)[0:-1]))
+        return FileEntryLock(_path, timeout=timeout)
+
+    def load(self, path: str, model_type: Type[T] = None) -> T:
+        # loads the data as an object
+        res = self.load_or_none(path, model_type=model_type)
+        if res is None:
+            raise LoadOjbectException(f"Could not load data at {path} (exp: not found)")
+        return res
+
+    def _to_model(self, data: Dict[str, Any], model_type: Type[T] = None) -> T:
         if not model_type:
-            for klass in [
-                obj
-                for name, obj in inspect.getmembers(models)
-                if inspect.isclass(obj)
-                and name not in ["Base0", "BaseModel", "CategoryBase"]
-            ]:
-                try:
-                    res = klass(**data)
-                    break
-                except Exception as exp:
-                    # load didn't work, try next model
-                    pass
+            # every saved model records its class in model_name
+            try:
+                model_type = models.get_model_type(data.get("model_name", ""))
+            except models.UnknownModelException as exp:
+                raise LoadOjbectException(exp)
+        if hasattr(model_type, "from_storage"):
+            # trusted: we wrote it, timestamps are kept as stored
+            try:
+                return model_type.from_storage(data)
+            except Exception as exp:
+                raise LoadOjbectException(exp)
         else:
             try:
                 res = model_type(**data)
@@ -157,15 +428,25 @@ class DataManager:
     def rm(self, path: str, recursive: bool = False) -> bool:
         _path = self._get_full_path(path)
         res = self.fs.rm(_path, recursive=recursive)
+        self._invalidate(_path)
         return True
 
+    def rm_if_exists(self, path: str) -> bool:
+        _path = self._get_full_path(path)
+        res = self.fs.rm_if_exists(_path)
+        self._invalidate(_path)
+        return res
+
     def mv(self, src_path: str, dst_path: str) -> bool:
         _src_path = self._get_full_path(src_path)
 
         _dst_path = self._get_full_path(dst_path)
         dirname = sep.join(_dst_path.split(sep)[0:-1])
         self.fs.mkdir(dirname)
-        return self.fs.mv(src_path=_src_path, dst_path=_dst_path)
+        res = self.fs.mv(src_path=_src_path, dst_path=_dst_path)
+        self._invalidate(_src_path)
+        self._invalidate(_dst_path)
+        return res
 
     def get_dir_key_value(self, path: str) -> Dict[str, str]:
         _path = self._get_full_path(path)
@@ -178,6 +459,7 @@ class DataManager:
     def mkdir(self, path) -> bool:
         _path = self._get_full_path(path)
         res = self.fs.mkdir(_path)
+        self._invalidate(_path)
         return True
 
     def exists(self, path) -> bool:
@@ -190,6 +472,136 @@ class DataManager:
             pass
         return False
 
+    # #####
+    # async
+    # #####
+    async def aget(self, path: str) -> Any:  # file like object
+        _path = self._get_full_path(path)
+        if self.afs:
+            return await self.afs.get(_path)
+        return await asyncio.to_thread(self.fs.get, _path)
+
+    async def aget_or_none(self, path: str) -> Any:  # file like object or None
+        _path = self._get_full_path(path)
+        if self.afs:
+            return await self.afs.get_or_none(_path)
+        return await asyncio.to_thread(self.fs.get_or_none, _path)
+
+    async def _aread_data_or_none(
+        self, full_path: str, use_cache: bool = True
+    ) -> Optional[Any]:
+        data, version = None, None
+        if use_cache and self.shared_cache:
+            data, version = self.shared_cache.get("data", full_path)
+        if data is None:
+            if self.afs:
+                raw = await self.afs.get_bytes_or_none(full_path)
+            else:
+                raw = await asyncio.to_thread(self.fs.get_bytes_or_none, full_path)
+            if raw is None:
+                return None
+            data = serialization.decode(raw)
+            if use_cache and self.shared_cache:
+                self.shared_cache.set("data", full_path, data, version)
+        return data
+
+    async def aload_or_none(
+        self, path: str, model_type: Type[T] = None
+    ) -> Optional[T]:
+        try:
+            data = await self._aread_data_or_none(self._get_full_path(path))
+            if data is None:
+                return None
+        except Exception as exp:
+            raise LoadOjbectException(f"Could not load data at {path} (exp: {exp})")
+        return self._to_model(data, model_type=model_type)
+
+    async def aload_composed_or_none(
+        self, paths: List[str], model_type: Type[T] = None, use_cache: bool = True
+    ) -> Optional[T]:
+        # see load_composed_or_none
+        try:
+            docs = await asyncio.gather(
+                *[
+                    self._aread_data_or_none(
+                        self._get_full_path(x), use_cache=use_cache
+                    )
+                    for x in paths
+                ]
+            )
+            data = self._compose(docs)
+        except Exception as exp:
+            raise LoadOjbectException(f"Could not load data at {paths} (exp: {exp})")
+        return None if data is None else self._to_model(data, model_type=model_type)
+
+    async def aload(self, path: str, model_type: Type[T] = None) -> T:
+        res = await self.aload_or_none(path, model_type=model_type)
+        if res is None:
+            raise LoadOjbectException(f"Could not load data at {path} (exp: not found)")
+        return res
+
+    async def aexists(self, path: str) -> bool:
+        if not self.afs:
+            return await asyncio.to_thread(self.exists, path)
+        try:
+            res = await self.afs.exists(self._get_full_path(path))
+            return True if res else False
+        except Exception as exp:
+            # path does not exist
+            pass
+        return False
+
+    async def als(self, path: str) -> List[str]:
+        if not self.afs:
+            return await asyncio.to_thread(self.ls, path)
+        try:
+            return await self.afs.ls(path=self._get_full_path(path))
+        except ListPathExceptionWeed as exp:
+            raise ListPathException(exp)
+
+    async def asave(self, obj: T) -> bool:
+        if not self.afs:
+            return await asyncio.to_thread(self.save, obj)
+        # directories are only created by the sync file system
+        await asyncio.to_thread(self.mkdir, obj.get_parent_path())
+        for path, data in obj.documents().items():
+            full_path = self._get_full_path(path)
+            await self.afs.put(
+                path=full_path,
+                obj=serialization.encode(data),
+                ttl=obj.get_ttl(),
+            )
+            self._invalidate(full_path)
+        return True
+
+    def run(self, coro: Awaitable) -> Any:
+        """runs a coroutine to completion from sync code (eg: a flask view)
+
+        every call runs on the one event loop of the process, so the sessions
+        (and pooled connections) of the async file system are kept between calls
+        """
+        return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: int = 0
+_loop_lock = threading.Lock()
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    # started on first use in a daemon thread. a forked child (eg: a celery
+    # worker) doesn't have the parent's thread, it starts a loop of its own
+    global _loop, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="datamgr-loop", daemon=True
+                ).start()
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
 
 def get_data_manager(file_system_type: str = "") -> DataManager:
     _file_system_type = (
@@ -197,6 +609,7 @@ def get_data_manager(file_system_type: str = "") -> DataManager:
     )
     _file_system_type = _file_system_type.lower()
     file_system = None
+    async_file_system = None
     base_folder = None
 
     extra_info = ""
@@ -205,12 +618,46 @@ def get_data_manager(file_system_type: str = "") -> DataManager:
         file_system = LocalFileSystem()
     elif _file_system_type == "weedfs":
         base_folder = config.WEEDFS_BASE_FOLDER
-        file_system = WeedFileSystem(url_base=config.WEEDFS_FILER_URL)
+        file_system = WeedFileSystem(
+            url_base=config.WEEDFS_FILER_URL,
+            pool_size=config.WEEDFS_POOL_SIZE,
+            max_retries=config.WEEDFS_MAX_RETRIES,
+            backoff_factor=config.WEEDFS_BACKOFF_FACTOR,
+            timeout=config.WEEDFS_TIMEOUT_SECONDS,
+        )
+        async_file_system = AsyncWeedFileSystem(
+            url_base=config.WEEDFS_FILER_URL,
+            pool_size=config.WEEDFS_POOL_SIZE,
+            timeout=config.WEEDFS_TIMEOUT_SECONDS,
+        )
         extra_info = f"at Weedfs url of {config.WEEDFS_FILER_URL} "
     else:
         raise ValueError(f"Unknown file system type {_file_system_type}")
 
-    return DataManager(file_system, base_folder)
+    shared_cache = None
+    if config.ENABLE_SHARED_CACHE:
+        shared_cache = SharedCache(
+            url=config.SHARED_CACHE_URL,
+            ttl=config.SHARED_CACHE_TTL_SECONDS,
+            prefix=base_folder,
+            version=config.SHARED_CACHE_VERSION,
+        )
+
+    # the weedfs filer has no atomic create-if-absent to build a lock on
+    lock_backend = config.LOCK_BACKEND or (
+        "redis" if _file_system_type == "weedfs" else "file"
+    )
+    lock_redis = None
+    if lock_backend == "redis":
+        lock_redis = Redis.from_url(config.LOCK_REDIS_URL)
+
+    return DataManager(
+        file_system,
+        base_folder,
+        async_file_system=async_file_system,
+        shared_cache=shared_cache,
+        lock_redis=lock_redis,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,426 @@
+# capped, ordered collections of ids: time ordered feeds (eg: the latest
+# campaigns) and score ordered leaderboards (eg: the best campaigns), plus
+# counters (eg: campaigns per category)
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis import Redis
+
+from config import config
+from data_manager import DataManager, LoadOjbectException, sep
+
+# (score, id), scores are unix timestamps
+FeedEntry = Tuple[float, str]
+# reads of a document that fails to decode before the error is raised
+READ_ATTEMPTS = 3
+# rows a redis feed page fetches beyond its limit, for the ids tied with the cursor
+READ_PAGE_SLACK = 64
+
+
+class InvalidFeedCursorException(Exception):
+    pass
+
+
+def encode_cursor(entry: FeedEntry) -> str:
+    return f"{entry[0]!r}_{entry[1]}"
+
+
+def decode_cursor(cursor: str) -> FeedEntry:
+    score, _, oid = cursor.partition("_")
+    try:
+        return float(score), oid
+    except ValueError as exp:
+        raise InvalidFeedCursorException(f"Invalid cursor {cursor} (exp: {exp})")
+
+
+def read_document_or_none(
+    datamgr: DataManager, path: str, use_cache: bool = True
+) -> Optional[dict]:
+    """the documents of the file backends are read without their lock
+
+    a write replaces a document whole on the local file system and the filer,
+    a read that still can't decode it (eg: a store without atomic writes) is
+    retried before giving up
+    """
+    for attempt in range(READ_ATTEMPTS):
+        try:
+            return datamgr.read_document_or_none(path, use_cache=use_cache)
+        except LoadOjbectException:
+            if attempt == READ_ATTEMPTS - 1:
+                raise
+            # past the cache, the cached copy can't be torn
+            use_cache = False
+            time.sleep(0.01)
+
+
+class Feed:
+    """newest-first list of at most capacity ids
+
+    before is a keyset cursor: read returns entries strictly older than it
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+
+    def append(self, oid: str, score: float) -> bool:
+        """adds oid unless already present, returns True if it was added"""
+        raise NotImplementedError()
+
+    def remove(self, oid: str) -> bool:
+        raise NotImplementedError()
+
+    def read(self, limit: int, before: Optional[FeedEntry] = None) -> List[FeedEntry]:
+        raise NotImplementedError()
+
+    def count(self) -> int:
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def page(self, limit: int, cursor: str = "") -> Tuple[List[str], str]:
+        """returns a page of ids and the cursor of the next page ('' if last)"""
+        before = decode_cursor(cursor) if cursor else None
+        # one extra entry tells us whether there is a next page
+        entries = self.read(limit + 1, before=before)
+        next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else ""
+        return [x[1] for x in entries[0:limit]], next_cursor
+
+
+class FileFeed(Feed):
+    """ring buffer stored as a single document
+
+    appending overwrites the oldest slot, reading the newest k walks back from
+    the head, so entries are ordered by when they were appended. an entry
+    older than the newest one (eg: from a reindex) re-slots the buffer in score
+    order instead. writers are serialized with an EntryLock
+    """
+
+    def __init__(self, name: str, capacity: int, datamgr: DataManager):
+        super().__init__(name, capacity)
+        self.datamgr = datamgr
+        self.path = sep.join(["Feed", f"{name}.json"])
+
+    def _load(self, use_cache: bool = True) -> dict:
+        doc = read_document_or_none(self.datamgr, self.path, use_cache=use_cache)
+        if not doc or doc.get("capacity") != self.capacity:
+            # new feed, or the capacity changed: re-slot the existing entries
+            entries = list(self._ordered(doc)) if doc else []
+            doc = dict(capacity=self.capacity, head=0, slots=[None] * self.capacity)
+            for entry in reversed(entries[0 : self.capacity]):
+                self._push(doc, entry)
+        return doc
+
+    @staticmethod
+    def _push(doc: dict, entry: FeedEntry):
+        doc["slots"][doc["head"]] = list(entry)
+        doc["head"] = (doc["head"] + 1) % doc["capacity"]
+
+    @staticmethod
+    def _ordered(doc: dict):
+        # newest first, starting just behind the head
+        slots = doc["slots"]
+        head = doc["head"]
+        for i in range(1, len(slots) + 1):
+            slot = slots[(head - i) % len(slots)]
+            if slot:
+                yield (slot[0], slot[1])
+
+    def append(self, oid: str, score: float) -> bool:
+        with self.datamgr.lock(self.path):
+            doc = self._load(use_cache=False)
+            if [x for x in doc["slots"] if x and x[1] == oid]:
+                return False
+            entries = list(self._ordered(doc))
+            if entries and (score, oid) < entries[0]:
+                if len(entries) >= self.capacity and (score, oid) < entries[-1]:
+                    # full and older than everything kept
+                    return False
+                entries = sorted(entries + [(score, oid)], reverse=True)
+                doc = dict(capacity=self.capacity, head=0, slots=[None] * self.capacity)
+                for entry in reversed(entries[0 : self.capacity]):
+                    self._push(doc, entry)
+            else:
+                self._push(doc, (score, oid))
+            self.datamgr.write_document(self.path, doc)
+        return True
+
+    def remove(self, oid: str) -> bool:
+        with self.datamgr.lock(self.path):
+            doc = self._load(use_cache=False)
+            slots = [None if x and x[1] == oid else x for x in doc["slots"]]
+            if slots == doc["slots"]:
+                return False
+            doc["slots"] = slots
+            self.datamgr.write_document(self.path, doc)
+        return True
+
+    def read(self, limit: int, before: Optional[FeedEntry] = None) -> List[FeedEntry]:
+        res = []
+        for entry in self._ordered(self._load()):
+            if before and (entry[0], entry[1]) >= before:
+                continue
+            res.append(entry)
+            if len(res) >= limit:
+                break
+        return res
+
+    def count(self) -> int:
+        return len([x for x in self._load()["slots"] if x])
+
+    def clear(self):
+        self.datamgr.rm_if_exists(self.path)
+
+
+class RedisFeed(Feed):
+    """sorted set scored by time, trimmed to capacity on every append"""
+
+    def __init__(self, name: str, capacity: int, redis: Redis):
+        super().__init__(name, capacity)
+        self.redis = redis
+        self.key = f"feed:{name}"
+
+    def append(self, oid: str, score: float) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.key, {oid: score}, nx=True)
+        pipe.zremrangebyrank(self.key, 0, -(self.capacity + 1))
+        added, _ = pipe.execute()
+        return bool(added)
+
+    def remove(self, oid: str) -> bool:
+        return bool(self.redis.zrem(self.key, oid))
+
+    def read(self, limit: int, before: Optional[FeedEntry] = None) -> List[FeedEntry]:
+        if not before:
+            rows = self.redis.zrevrange(self.key, 0, limit - 1, withscores=True)
+            return [self._entry(x) for x in rows]
+        # ties on the score are broken by id, matching FileFeed. the ids tied
+        # with the cursor come first and are skipped, as many pages as it takes
+        res = []
+        start = 0
+        num = limit + READ_PAGE_SLACK
+        while len(res) < limit:
+            rows = self.redis.zrevrangebyscore(
+                self.key, before[0], "-inf", start=start, num=num, withscores=True
+            )
+            res.extend(x for x in map(self._entry, rows) if x < before)
+            if len(rows) < num:
+                break
+            start += num
+        return res[0:limit]
+
+    @staticmethod
+    def _entry(row: Tuple[Any, float]) -> FeedEntry:
+        oid, score = row
+        return (score, oid.decode() if isinstance(oid, bytes) else oid)
+
+    def count(self) -> int:
+        return self.redis.zcard(self.key)
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+class Leaderboard:
+    """the capacity highest scoring ids, highest first
+
+    maintained incrementally: an id that falls out of the top is forgotten
+    until its score is updated again
+    """
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+
+    def update(self, scores: Dict[str, Optional[float]]):
+        """sets the score of each id, a score of None removes the id"""
+        raise NotImplementedError()
+
+    def changes(
+        self, scores: Dict[str, Optional[float]], current: Dict[str, float]
+    ) -> Dict[str, Optional[float]]:
+        """the updates that would change a board holding current: those of ids
+        on it and those scoring into its top
+        """
+        if len(current) < self.capacity:
+            return {x: y for x, y in scores.items() if y is not None or x in current}
+        # the sort key of the lowest entry kept, see FileLeaderboard
+        lowest = max((-score, oid) for oid, score in current.items())
+        return {
+            x: y
+            for x, y in scores.items()
+            if x in current or (y is not None and (-y, x) < lowest)
+        }
+
+    def read(self, limit: int) -> List[FeedEntry]:
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class FileLeaderboard(Leaderboard):
+    """top entries kept in a single document, writers serialized with an EntryLock"""
+
+    def __init__(self, name: str, capacity: int, datamgr: DataManager):
+        super().__init__(name, capacity)
+        self.datamgr = datamgr
+        self.path = sep.join(["Leaderboard", f"{name}.json"])
+
+    def _load(self, use_cache: bool = True) -> Dict[str, float]:
+        doc = read_document_or_none(self.datamgr, self.path, use_cache=use_cache)
+        return doc.get("scores", {}) if doc else {}
+
+    def update(self, scores: Dict[str, Optional[float]]):
+        # most updates (eg: a contribution to a campaign far down the list)
+        # change nothing, they are dropped without taking the lock
+        if not self.changes(scores, self._load(use_cache=False)):
+            return
+        with self.datamgr.lock(self.path):
+            current = self._load(use_cache=False)
+            entries = dict(current)
+            for oid, score in scores.items():
+                if score is None:
+                    entries.pop(oid, None)
+                else:
+                    entries[oid] = score
+            top = sorted(entries.items(), key=lambda x: (-x[1], x[0]))
+            entries = dict(top[0 : self.capacity])
+            if entries != current:
+                self.datamgr.write_document(
+                    self.path, dict(capacity=self.capacity, scores=entries)
+                )
+
+    def read(self, limit: int) -> List[FeedEntry]:
+        top = sorted(self._load().items(), key=lambda x: (-x[1], x[0]))
+        return [(score, oid) for oid, score in top[0:limit]]
+
+    def clear(self):
+        self.datamgr.rm_if_exists(self.path)
+
+
+class RedisLeaderboard(Leaderboard):
+    """sorted set trimmed to capacity on every update"""
+
+    def __init__(self, name: str, capacity: int, redis: Redis):
+        super().__init__(name, capacity)
+        self.redis = redis
+        self.key = f"leaderboard:{name}"
+
+    def update(self, scores: Dict[str, Optional[float]]):
+        pipe = self.redis.pipeline()
+        removed = [oid for oid, score in scores.items() if score is None]
+        added = {oid: score for oid, score in scores.items() if score is not None}
+        if removed:
+            pipe.zrem(self.key, *removed)
+        if added:
+            pipe.zadd(self.key, added)
+        pipe.zremrangebyrank(self.key, 0, -(self.capacity + 1))
+        pipe.execute()
+
+    def read(self, limit: int) -> List[FeedEntry]:
+        rows = self.redis.zrevrange(self.key, 0, limit - 1, withscores=True)
+        return [
+            (score, oid.decode() if isinstance(oid, bytes) else oid)
+            for oid, score in rows
+        ]
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+class Counters:
+    """named integer counters (eg: campaigns per category), adjusted by deltas
+
+    each incr is atomic, concurrent writers never lose an update
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def incr(self, deltas: Dict[str, int]):
+        raise NotImplementedError()
+
+    def read(self) -> Dict[str, int]:
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class FileCounters(Counters):
+    """counts kept in a single document, writers serialized with an EntryLock"""
+
+    def __init__(self, name: str, datamgr: DataManager, path: str = ""):
+        super().__init__(name)
+        self.datamgr = datamgr
+        self.path = path or sep.join(["Counters", f"{name}.json"])
+
+    def incr(self, deltas: Dict[str, int]):
+        with self.datamgr.lock(self.path):
+            doc = read_document_or_none(self.datamgr, self.path, use_cache=False)
+            counts = doc.get("counts", {}) if doc else {}
+            for key, delta in deltas.items():
+                counts[key] = max(0, counts.get(key, 0) + delta)
+            self.datamgr.write_document(self.path, dict(counts=counts))
+
+    def read(self) -> Dict[str, int]:
+        doc = read_document_or_none(self.datamgr, self.path)
+        return doc.get("counts", {}) if doc else {}
+
+    def clear(self):
+        self.datamgr.rm_if_exists(self.path)
+
+
+class RedisCounters(Counters):
+    """a hash adjusted with HINCRBY"""
+
+    def __init__(self, name: str, redis: Redis):
+        super().__init__(name)
+        self.redis = redis
+        self.key = f"counters:{name}"
+
+    def incr(self, deltas: Dict[str, int]):
+        pipe = self.redis.pipeline()
+        for key, delta in deltas.items():
+            pipe.hincrby(self.key, key, delta)
+        pipe.execute()
+
+    def read(self) -> Dict[str, int]:
+        return {
+            (k.decode() if isinstance(k, bytes) else k): max(0, int(v))
+            for k, v in self.redis.hgetall(self.key).items()
+        }
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+_redis = None
+
+
+def _get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(config.FEED_REDIS_URL)
+    return _redis
+
+
+def get_feed(name: str, capacity: int, datamgr: DataManager) -> Feed:
+    if config.FEED_BACKEND == "redis":
+        return RedisFeed(name, capacity, redis=_get_redis())
+    return FileFeed(name, capacity, datamgr=datamgr)
+
+
+def get_leaderboard(name: str, capacity: int, datamgr: DataManager) -> Leaderboard:
+    if config.FEED_BACKEND == "redis":
+        return RedisLeaderboard(name, capacity, redis=_get_redis())
+    return FileLeaderboard(name, capacity, datamgr=datamgr)
+
+
+def get_counters(name: str, datamgr: DataManager, path: str = "") -> Counters:
+    # path places the document of the file backend (default Counters/<name>.json)
+    if config.FEED_BACKEND == "redis":
+        return RedisCounters(name, redis=_get_redis())
+    return FileCounters(name, datamgr=datamgr, path=path)
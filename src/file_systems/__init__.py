@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 
 
 class FileSystem:
@@ -11,6 +11,18 @@ class FileSystem:
     def rm(self, path: str) -> bool:
         raise NotImplementedError()
 
+    def get_or_none(self, path: str) -> Any:
+        # like get() but returns None when nothing is at path
+        raise NotImplementedError()
+
+    def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        # the raw content at path whatever its type, None when nothing is there
+        raise NotImplementedError()
+
+    def rm_if_exists(self, path: str) -> bool:
+        # returns True if something was removed, False if nothing was at path
+        raise NotImplementedError()
+
     def exists(self, path: str) -> bool:
         raise NotImplementedError()
 
@@ -24,5 +36,32 @@ class FileSystem:
         raise NotImplementedError()
 
 
+class AsyncFileSystem:
+    async def get(self, path: str) -> Any:
+        raise NotImplementedError()
+
+    async def put(self, path: str, obj: Any, ttl: str = "") -> bool:
+        raise NotImplementedError()
+
+    async def rm(self, path: str) -> bool:
+        raise NotImplementedError()
+
+    async def get_or_none(self, path: str) -> Any:
+        raise NotImplementedError()
+
+    async def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        raise NotImplementedError()
+
+    async def exists(self, path: str) -> bool:
+        raise NotImplementedError()
+
+    async def ls(self, path: str) -> bool:
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+
 from file_systems.local import LocalFileSystem
 from file_systems.weed import WeedFileSystem
+from file_systems.weed_async import AsyncWeedFileSystem
@@ -2,10 +2,14 @@
 import mimetypes
 import os
 import shutil
-from typing import Any, List
+import tempfile
+from typing import Any, List, Optional
 
 from file_systems import FileSystem
 
+# suffix of the temporary files put writes before renaming them into place
+TMP_SUFFIX = ".put"
+
 
 class NotFoundLocal(Exception):
     pass
@@ -31,26 +35,59 @@ class LocalFileSystem(FileSystem):
         except:
             raise NotFoundLocal(f"Nothing found at {path}")
 
+    def get_or_none(self, path: str) -> Any:
+        try:
+            return open(path)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+
+    def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+
     def put(self, path: str, obj: Any, ttl: str = "") -> bool:
         # ttl is ignored, but kept here for compatibility
         write_attr = "wb"
-        if self._is_text_file_type(path):
+        if self._is_text_file_type(path) and not isinstance(obj, bytes):
             write_attr = "w"
 
-        with open(path, write_attr) as f:
-            if hasattr(obj, "read") and hasattr(obj, "write"):
-                f.write(obj.read())
-            else:
-                if write_attr == "wb":
-                    f.write(obj.encode("UTF-8"))
+        # written next to path and renamed over it, so a reader (eg: of a
+        # feed document, read without its lock) never sees a partial file
+        dirname, basename = os.path.split(path)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirname, prefix=f".{basename}.", suffix=TMP_SUFFIX
+        )
+        try:
+            with os.fdopen(fd, write_attr) as f:
+                if hasattr(obj, "read") and hasattr(obj, "write"):
+                    f.write(obj.read())
                 else:
-                    f.write(obj)
+                    if write_attr == "wb":
+                        f.write(obj if isinstance(obj, bytes) else obj.encode("UTF-8"))
+                    else:
+                        f.write(obj)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
         return True
 
     def rm(self, path: str, recursive: bool = False) -> bool:
-        if os.path.exists(path):
-            shutil.rmtree(path)
+        self.rm_if_exists(path)
+        return True
 
+    def rm_if_exists(self, path: str) -> bool:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            return False
         return True
 
     def exists(self, path: str) -> bool:
@@ -62,7 +99,12 @@ class LocalFileSystem(FileSystem):
 
     def ls(self, path: str) -> List[str]:
         try:
-            return os.listdir(path)
+            # puts in flight aren't entries yet
+            return [
+                x
+                for x in os.listdir(path)
+                if not (x.startswith(".") and x.endswith(TMP_SUFFIX))
+            ]
         except Exception as exp:
             raise ListPathExceptionLocal(exp)
 
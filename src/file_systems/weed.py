@@ -1,5 +1,5 @@
 # wraps calls to weedfs
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from file_systems import FileSystem
 from file_systems.weedfs import WeedFS, ListPathException
@@ -18,8 +18,9 @@ class ListPathExceptionWeed(Exception):
 
 
 class WeedFileSystem(FileSystem):
-    def __init__(self, url_base):
-        self.wf = WeedFS(url_base=url_base)
+    def __init__(self, url_base, **kwargs):
+        # kwargs are passed through to WeedFS (pool_size, max_retries, etc)
+        self.wf = WeedFS(url_base=url_base, **kwargs)
 
     def get(self, path: str) -> Any:
         """gets what ever is at path (if anthing)"""
@@ -29,6 +30,18 @@ class WeedFileSystem(FileSystem):
         except Exception as exp:
             raise NotFoundWeed(f"Nothing found at {path}")
 
+    def get_or_none(self, path: str) -> Any:
+        try:
+            return self.wf.get_or_none(path)
+        except Exception as exp:
+            raise NotFoundWeed(f"Could not get {path} (exp: {exp})")
+
+    def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        try:
+            return self.wf.get_bytes_or_none(path)
+        except Exception as exp:
+            raise NotFoundWeed(f"Could not get {path} (exp: {exp})")
+
     def put(self, path: str, obj: Any, ttl: str = "") -> bool:
         if path.endswith("/"):
             raise Exception(f"Cannot put a directory with path {path}")
@@ -52,6 +65,10 @@ class WeedFileSystem(FileSystem):
         self.wf.delete(path)
         return True
 
+    def rm_if_exists(self, path: str) -> bool:
+        # like LocalFileSystem, a folder is removed with everything in it
+        return self.wf.delete_if_exists(path, recursive=True)
+
     def is_dir(self, path: str) -> bool:
         return self.wf.is_dir(path)
 
@@ -0,0 +1,60 @@
+# wraps calls to weedfs using asyncio
+from typing import Any, List, Optional
+
+from file_systems import AsyncFileSystem
+from file_systems.weed import NotFoundWeed, NotWrittenWeed, ListPathExceptionWeed
+from file_systems.weedfs import ListPathException
+from file_systems.weedfs_async import AsyncWeedFS
+
+
+class AsyncWeedFileSystem(AsyncFileSystem):
+    def __init__(self, url_base, **kwargs):
+        # kwargs are passed through to AsyncWeedFS (pool_size, timeout)
+        self.wf = AsyncWeedFS(url_base=url_base, **kwargs)
+
+    async def get(self, path: str) -> Any:
+        """gets what ever is at path (if anthing)"""
+        try:
+            return await self.wf.get(path)
+        except Exception as exp:
+            raise NotFoundWeed(f"Nothing found at {path}")
+
+    async def get_or_none(self, path: str) -> Any:
+        try:
+            return await self.wf.get_or_none(path)
+        except Exception as exp:
+            raise NotFoundWeed(f"Could not get {path} (exp: {exp})")
+
+    async def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        try:
+            return await self.wf.get_bytes_or_none(path)
+        except Exception as exp:
+            raise NotFoundWeed(f"Could not get {path} (exp: {exp})")
+
+    async def put(self, path: str, obj: Any, ttl: str = "") -> bool:
+        if path.endswith("/"):
+            raise Exception(f"Cannot put a directory with path {path}")
+        try:
+            kwargs = dict(path=path, data=obj)
+            if ttl:
+                kwargs["ttl"] = ttl
+            await self.wf.put(**kwargs)
+            return True
+        except Exception as exp:
+            raise NotWrittenWeed(f"Could not write data to {path} - (exp: {exp})")
+
+    async def rm(self, path: str) -> bool:
+        await self.wf.delete(path)
+        return True
+
+    async def exists(self, path: str) -> bool:
+        return True if await self.wf.head(path) else False
+
+    async def ls(self, path: str) -> List[str]:
+        try:
+            return await self.wf.ls(path)
+        except ListPathException as exp:
+            raise ListPathExceptionWeed(exp)
+
+    async def close(self):
+        await self.wf.close()
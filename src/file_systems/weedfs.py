@@ -4,9 +4,12 @@ import json
 import logging
 import mimetypes
 import os
-from typing import Any, Dict, List
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import quote, urlencode, urljoin, urlsplit, urlunparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 class ListPathException(Exception):
@@ -18,8 +21,22 @@ class MoveException(Exception):
 
 
 class WeedFS:
-    def __init__(self, url_base: str):
+    def __init__(
+        self,
+        url_base: str,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.1,
+        timeout: float = 10,
+    ):
         self.url_base = url_base
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        # requests.Session is not guaranteed to be thread safe so each thread
+        # (eg: gunicorn gthread workers) gets its own keep-alive session
+        self._local = threading.local()
         parts = urlsplit(self.url_base)
 
         self.scheme = parts.scheme
@@ -31,6 +48,33 @@ class WeedFS:
 
         self.text_file_types = ["text", "application/json"]  # 'startswith' match
 
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._create_session()
+            self._local.session = session
+        return session
+
+    def _create_session(self) -> requests.Session:
+        # only idempotent methods are retried. POST (put, mv) is left to the caller
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "HEAD", "DELETE"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def _is_text_file_type(self, content_type: str) -> bool:
         return (
             True
@@ -42,7 +86,7 @@ class WeedFS:
         url = urljoin(self.url_base, quote(path))
         rsp = None
         try:
-            rsp = requests.get(url)
+            rsp = self.session.get(url, timeout=self.timeout)
         except Exception as exp:
             raise Exception(f"Error GETing {url}. (exp: {exp}")
         if not rsp.ok:
@@ -53,11 +97,36 @@ class WeedFS:
             return StringIO(rsp.content.decode())
         return BytesIO(rsp.content)
 
+    def get_or_none(self, path: str) -> Any:  # file like object or None
+        content, content_type = self._get_content_or_none(path)
+        if content is None:
+            return None
+        if self._is_text_file_type(content_type):
+            return StringIO(content.decode())
+        return BytesIO(content)
+
+    def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        return self._get_content_or_none(path)[0]
+
+    def _get_content_or_none(self, path: str) -> Tuple[Optional[bytes], str]:
+        url = urljoin(self.url_base, quote(path))
+        try:
+            rsp = self.session.get(url, timeout=self.timeout)
+        except Exception as exp:
+            raise Exception(f"Error GETing {url}. (exp: {exp}")
+        if rsp.status_code == 404:
+            return None, ""
+        if not rsp.ok:
+            raise Exception(
+                f"Error GETing {url}. (exp: response not ok - {rsp.ok} / {rsp.status_code}"
+            )
+        return rsp.content, rsp.headers.get("Content-Type", "")
+
     def is_dir(self, path: str) -> bool:
         url = urljoin(self.url_base, quote(path))
         entries = []
         try:
-            rsp = requests.get(url, headers=self.headers)
+            rsp = self.session.get(url, headers=self.headers, timeout=self.timeout)
             if not rsp.ok:
                 return False
             # only files have etag in header
@@ -76,6 +145,8 @@ class WeedFS:
         fp = None
         if hasattr(data, "read") and hasattr(data, "write"):
             fp = data
+        elif isinstance(data, bytes):
+            fp = BytesIO(data)
         else:
             if self._is_text_file_type(path):
                 fp = StringIO(data)
@@ -85,7 +156,7 @@ class WeedFS:
         fp.seek(0)
 
         try:
-            rsp = requests.post(url, files={"file": fp})
+            rsp = self.session.post(url, files={"file": fp}, timeout=self.timeout)
             if rsp.ok:
                 return True
             else:
@@ -97,13 +168,28 @@ class WeedFS:
     def delete(self, path: str) -> bool:
         url = urljoin(self.url_base, quote(path))
         try:
-            rsp = requests.delete(url)
+            rsp = self.session.delete(url, timeout=self.timeout)
             if not rsp.ok:
                 raise Exception(f"{rsp.status_code} DELETE {url}")
             return True
         except Exception as exp:
             raise Exception(f"Error deleting file: {path} (exp: {exp})")
 
+    def delete_if_exists(self, path: str, recursive: bool = False) -> bool:
+        # the filer refuses to delete a folder that isn't empty unless recursive
+        url = urljoin(self.url_base, quote(path))
+        if recursive:
+            url += "?" + urlencode(dict(recursive="true"))
+        try:
+            rsp = self.session.delete(url, timeout=self.timeout)
+        except Exception as exp:
+            raise Exception(f"Error deleting file: {path} (exp: {exp})")
+        if rsp.status_code == 404:
+            return False
+        if not rsp.ok:
+            raise Exception(f"Error deleting file: {path} ({rsp.status_code} DELETE {url})")
+        return True
+
     def ls(self, path: str, only_filenames=True) -> List[str]:
         _path = path if path.endswith("/") else (path + "/")
         url = urljoin(self.url_base, quote(_path))
@@ -111,7 +197,7 @@ class WeedFS:
         headers = {"Accept": "application/json"}
         data = []
         try:
-            rsp = requests.get(url, headers=headers)
+            rsp = self.session.get(url, headers=headers, timeout=self.timeout)
             if not rsp.ok:
                 raise Exception(f"{rsp.status_code} GET {url}")
             data = rsp.json()
@@ -133,7 +219,7 @@ class WeedFS:
         headers = {"Accept": "application/json"}
 
         try:
-            rsp = requests.head(url, headers=headers)
+            rsp = self.session.head(url, headers=headers, timeout=self.timeout)
             if rsp.status_code == 404:
                 return {}
             if not rsp.ok:
@@ -161,7 +247,7 @@ class WeedFS:
         # > curl -X POST 'http://localhost:8888/path/to/dst_file?mv.from=/path/to/src_file'
         url = urljoin(self.url_base, quote(dst_path)) + "?mv.from=" + quote(src_path)
         try:
-            rsp = requests.post(url)
+            rsp = self.session.post(url, timeout=self.timeout)
             return True
         except Exception as exp:
             raise MoveException(f"Could not move {src_path} to {dst_path} (exp:{exp})")
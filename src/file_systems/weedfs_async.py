@@ -0,0 +1,159 @@
+# wrap calls to seaweedfs using asyncio
+from io import BytesIO, StringIO
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urljoin, urlsplit, urlunparse
+
+import aiohttp
+
+from file_systems.weedfs import ListPathException
+
+
+class AsyncWeedFS:
+    def __init__(self, url_base: str, pool_size: int = 10, timeout: float = 10):
+        self.url_base = url_base
+        parts = urlsplit(self.url_base)
+
+        self.scheme = parts.scheme
+        self.hostname = parts.hostname
+        if parts.port:
+            self.hostname += f":{parts.port}"
+
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {"accept": "application/json"}
+        self.text_file_types = ["text", "application/json"]  # 'startswith' match
+
+        # aiohttp sessions are bound to the event loop they were created in, so
+        # sessions are kept per thread. DataManager.run drives every call from
+        # the one loop thread of the process, other callers get their own
+        self._local = threading.local()
+
+    async def session(self) -> aiohttp.ClientSession:
+        session = getattr(self._local, "session", None)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._local.session = session
+        return session
+
+    async def close(self):
+        session = getattr(self._local, "session", None)
+        if session is not None and not session.closed:
+            await session.close()
+        self._local.session = None
+
+    def _is_text_file_type(self, content_type: str) -> bool:
+        return (
+            True
+            if [x for x in self.text_file_types if content_type.startswith(x)]
+            else False
+        )
+
+    async def get(self, path: str) -> Any:  # file like object
+        url = urljoin(self.url_base, quote(path))
+        session = await self.session()
+        try:
+            async with session.get(url) as rsp:
+                if not rsp.ok:
+                    raise Exception(f"response not ok - {rsp.ok} / {rsp.status}")
+                content = await rsp.read()
+                content_type = rsp.headers.get("Content-Type", "")
+        except Exception as exp:
+            raise Exception(f"Error GETing {url}. (exp: {exp}")
+        if self._is_text_file_type(content_type):
+            return StringIO(content.decode())
+        return BytesIO(content)
+
+    async def get_or_none(self, path: str) -> Any:  # file like object or None
+        content, content_type = await self._get_content_or_none(path)
+        if content is None:
+            return None
+        if self._is_text_file_type(content_type):
+            return StringIO(content.decode())
+        return BytesIO(content)
+
+    async def get_bytes_or_none(self, path: str) -> Optional[bytes]:
+        return (await self._get_content_or_none(path))[0]
+
+    async def _get_content_or_none(self, path: str) -> Tuple[Optional[bytes], str]:
+        url = urljoin(self.url_base, quote(path))
+        session = await self.session()
+        try:
+            async with session.get(url) as rsp:
+                if rsp.status == 404:
+                    return None, ""
+                if not rsp.ok:
+                    raise Exception(f"response not ok - {rsp.ok} / {rsp.status}")
+                return await rsp.read(), rsp.headers.get("Content-Type", "")
+        except Exception as exp:
+            raise Exception(f"Error GETing {url}. (exp: {exp}")
+
+    async def put(self, path: str, data: Any, **kwargs) -> bool:
+        query_string = urlencode(kwargs)
+        url = urlunparse(
+            (self.scheme, self.hostname, quote(path), "", query_string, "")
+        )
+
+        if hasattr(data, "read"):
+            data.seek(0)
+            data = data.read()
+        if isinstance(data, str):
+            data = data.encode("UTF-8")
+
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=os.path.basename(path))
+        session = await self.session()
+        try:
+            async with session.post(url, data=form) as rsp:
+                if not rsp.ok:
+                    raise Exception(f"{rsp.status} POST {url}")
+                return True
+        except Exception as exp:
+            raise Exception(f"Error POSTing url. (exp: {exp})")
+
+    async def delete(self, path: str) -> bool:
+        url = urljoin(self.url_base, quote(path))
+        session = await self.session()
+        try:
+            async with session.delete(url) as rsp:
+                if not rsp.ok:
+                    raise Exception(f"{rsp.status} DELETE {url}")
+                return True
+        except Exception as exp:
+            raise Exception(f"Error deleting file: {path} (exp: {exp})")
+
+    async def ls(self, path: str, only_filenames=True) -> List[str]:
+        _path = path if path.endswith("/") else (path + "/")
+        url = urljoin(self.url_base, quote(_path))
+        session = await self.session()
+        try:
+            async with session.get(url, headers=self.headers) as rsp:
+                if not rsp.ok:
+                    raise Exception(f"{rsp.status} GET {url}")
+                data = await rsp.json(content_type=None)
+        except Exception as exp:
+            raise ListPathException(f"Error listing path (exp: {exp})")
+        entries = data.get("Entries", []) or []
+
+        # sort by create date, ascending
+        entries = sorted(entries, key=lambda x: x.get("Crtime"))
+
+        if entries and only_filenames:
+            return [os.path.basename(x.get("FullPath", "")) for x in entries]
+
+        return entries
+
+    async def head(self, path: str) -> Dict[str, str]:
+        url = urljoin(self.url_base, quote(path))
+        session = await self.session()
+        try:
+            async with session.head(url, headers=self.headers) as rsp:
+                if rsp.status == 404:
+                    return {}
+                if not rsp.ok:
+                    raise Exception(f"{rsp.status} HEAD {url}")
+                return dict(rsp.headers)
+        except Exception as exp:
+            raise Exception(f"Error 'heading' {path} (exp: {exp})")
@@ -64,4 +64,9 @@ class DonationForm(FlaskForm):
 
 class SearchForm(FlaskForm):
     terms = StringField("Search", validators=[DataRequired()])
+    mode = RadioField(
+        "Match",
+        choices=[("and", "All words"), ("or", "Any word")],
+        default="and",
+    )
     submit = SubmitField("Search")
@@ -0,0 +1,122 @@
+# content addressed campaign images
+#
+# an upload is stored once under the sha256 of its bytes, so identical
+# uploads share one original. the sized/encoded variants served to browsers
+# are rendered from it by a celery task (tasks.generate_image_variants) and,
+# being immutable, can be cached by browsers and proxies forever
+from hashlib import sha256
+from io import BytesIO
+import re
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageOps
+
+from data_manager import get_data_manager, sep
+
+datamgr = get_data_manager()
+
+# name -> (width, height), card is the campaign lists at 2x their 200px width
+SIZES: Dict[str, Tuple[int, int]] = {
+    "full": (650, 450),
+    "card": (400, 277),
+}
+
+# format -> mimetype, in order of preference. png is the fallback every
+# browser accepts, avif needs a Pillow build/plugin that can write it
+MIMETYPES: Dict[str, str] = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+FORMATS: List[str] = [
+    x for x in MIMETYPES if f".{x}" in Image.registered_extensions() or x == "png"
+]
+
+_image_hash_re = re.compile(r"^[0-9a-f]{64}$")
+
+
+class InvalidImageException(Exception):
+    pass
+
+
+def is_image_hash(image_hash: str) -> bool:
+    return bool(_image_hash_re.match(image_hash))
+
+
+def build_parent_path(image_hash: str) -> str:
+    return sep.join(["Image", image_hash[-2:], image_hash])
+
+
+def build_original_path(image_hash: str) -> str:
+    return sep.join([build_parent_path(image_hash), "original"])
+
+
+def build_variant_path(image_hash: str, size: str, fmt: str) -> str:
+    return sep.join([build_parent_path(image_hash), f"{size}.{fmt}"])
+
+
+def store_original(img: Any) -> str:
+    """stores an upload (file like object) unless already stored, returns its hash"""
+    raw = img.read()
+    image_hash = sha256(raw).hexdigest()
+    path = build_original_path(image_hash)
+    if not datamgr.exists(path):
+        datamgr.mkdir(build_parent_path(image_hash))
+        datamgr.put(path=path, obj=raw)
+    return image_hash
+
+
+def render_variant(raw: bytes, size: str, fmt: str) -> bytes:
+    """the original scaled and center cropped to size, encoded as fmt"""
+    if size not in SIZES or fmt not in FORMATS:
+        raise InvalidImageException(f"Unknown image variant {size}.{fmt}")
+    image = Image.open(BytesIO(raw))
+    if image.mode not in ["RGB", "RGBA"]:
+        image = image.convert("RGBA")
+    image = ImageOps.fit(image, SIZES[size], Image.Resampling.LANCZOS)
+    out = BytesIO()
+    image.save(out, format=fmt.upper())
+    return out.getvalue()
+
+
+def get_variant(image_hash: str, size: str, fmt: str) -> bytes:
+    """the stored variant, rendered (and stored) now if the task hasn't yet"""
+    path = build_variant_path(image_hash, size, fmt)
+    raw = datamgr.get_bytes_or_none(path)
+    if raw is not None:
+        return raw
+    original = datamgr.get_bytes_or_none(build_original_path(image_hash))
+    if original is None:
+        raise InvalidImageException(f"No image with hash {image_hash}")
+    raw = render_variant(original, size, fmt)
+    datamgr.put(path=path, obj=raw)
+    return raw
+
+
+def generate_variants(image_hash: str) -> int:
+    """renders every missing size/format of an image, returns how many were written"""
+    original = None
+    written = 0
+    for size in SIZES:
+        for fmt in FORMATS:
+            path = build_variant_path(image_hash, size, fmt)
+            if datamgr.exists(path):
+                continue
+            if original is None:
+                original = datamgr.get_bytes_or_none(build_original_path(image_hash))
+                if original is None:
+                    raise InvalidImageException(f"No image with hash {image_hash}")
+            datamgr.put(path=path, obj=render_variant(original, size, fmt))
+            written += 1
+    return written
+
+
+def negotiate_format(accepted_mimetypes: List[str]) -> str:
+    """the preferred format the client explicitly accepts, png otherwise
+
+    wildcards are ignored: a browser sending only */* may not decode avif/webp
+    """
+    for fmt in FORMATS:
+        if MIMETYPES[fmt] in accepted_mimetypes:
+            return fmt
+    return "png"
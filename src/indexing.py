@@ -1,20 +1,47 @@
 # handles construction and manipulation of indicies
-from base64 import b64encode, b64decode
+from base64 import b64encode, b64decode, urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+import heapq
+import json
 from io import StringIO
-from string import punctuation
-from typing import Any, Dict, List, Tuple, Union
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import unquote, quote
-import nltk
 
+import arrow
+
+from cache import LRUCache
 from config import config
-from data_manager import get_data_manager, sep, ListPathException, LoadOjbectException
+from data_manager import (
+    DataManager,
+    get_data_manager,
+    sep,
+    ListPathException,
+    LoadOjbectException,
+)
+from feeds import Counters, Feed, Leaderboard, get_counters, get_feed, get_leaderboard
 from models import Campaign, User
+from postings import PostingList
+import tokenizer
 from utils import gen_random
 
-nltk.download("stopwords")
-from nltk.corpus import stopwords
-
 datamgr = get_data_manager()
+index_write_pool = ThreadPoolExecutor(
+    max_workers=config.INDEX_WRITE_MAX_WORKERS, thread_name_prefix="index"
+)
+_stores: Dict[Tuple[str, str], DataManager] = {}
 
 
 class InvalidIndexKwargException(Exception):
@@ -87,135 +114,785 @@ class EmailUserIndex(Index):
 
 
 class CategoryCampaignIndex(Index):
+    """membership markers per category, plus a newest-first feed per category
+    for paging (the newest CATEGORY_FEED_SIZE) and a counter of the campaigns in each
+    """
+
     target_model_name: str = "Campaigns"
+    summary_path: str = sep.join(["CategoryCampaignIndex", "summary.json"])
+
+    @classmethod
+    def feed_name(cls, category_id: str) -> str:
+        return f"category-{category_id}"
+
 
+class ActiveCampaignIndex(Index):
+    """markers of the campaigns below their goal, the ones the contribution
+    simulation advances. bucketed by the last character of the campaign id
+    """
 
-class WordCampaignIndex(Index):
     target_model_name: str = "Campaigns"
-    partition_scheme = 2
-    encode_ref_id = True
 
+    @classmethod
+    def build_campaign_path(cls, campaign_id: str) -> str:
+        return cls.build_path(ref_id=campaign_id[-1], target_id=campaign_id)
+
+
+class IndexGeneration:
+    """which generation of the campaign indexes is served, and which one (if
+    any) a reindex is building
+
+    "" is the indexes written before generations existed, at the root of the
+    store, later generations live under Index/<generation>. while a generation
+    is built every index write goes to it as well as to the served one, so it
+    misses nothing written during the rebuild. processes cache the pointer for
+    INDEX_GENERATION_TTL_SECONDS
+    """
+
+    path: str = "IndexGeneration.json"
+    cache = LRUCache(maxsize=1, ttl=config.INDEX_GENERATION_TTL_SECONDS)
+
+    @classmethod
+    def read(cls, use_cache: bool = True) -> Dict[str, str]:
+        doc = cls.cache.get(cls.path) if use_cache else None
+        if doc is None:
+            doc = datamgr.read_document_or_none(cls.path, use_cache=False) or {}
+            doc = dict(current=doc.get("current", ""), building=doc.get("building", ""))
+            cls.cache.set(cls.path, doc)
+        return doc
+
+    @classmethod
+    def _write(cls, current: str, building: str):
+        doc = dict(current=current, building=building)
+        datamgr.write_document(cls.path, doc)
+        cls.cache.set(cls.path, doc)
+
+    @classmethod
+    def current(cls) -> str:
+        return cls.read()["current"]
+
+    @classmethod
+    def resolve(cls, generation: Optional[str]) -> str:
+        # None is the served generation
+        return cls.current() if generation is None else generation
+
+    @classmethod
+    def writable(cls) -> List[str]:
+        doc = cls.read()
+        if doc["building"] and doc["building"] != doc["current"]:
+            return [doc["current"], doc["building"]]
+        return [doc["current"]]
+
+    @classmethod
+    def start_build(cls, generation: str) -> str:
+        """marks generation as being built, returns the build it replaces (or '')"""
+        with datamgr.lock(cls.path):
+            doc = cls.read(use_cache=False)
+            cls._write(doc["current"], generation)
+        return doc["building"]
+
+    @classmethod
+    def swap(cls, generation: str) -> str:
+        """serves the built generation, returns the generation it replaces"""
+        with datamgr.lock(cls.path):
+            doc = cls.read(use_cache=False)
+            if doc["building"] != generation:
+                raise InvalidIndexArgumentException(
+                    f"Generation {generation} is not being built"
+                )
+            cls._write(generation, "")
+        return doc["current"]
+
+    @classmethod
+    def store(cls, generation: str) -> DataManager:
+        """where the campaign indexes of a generation are stored"""
+        if not generation:
+            return datamgr
+        key = (datamgr.base_folder, generation)
+        if key not in _stores:
+            _stores[key] = datamgr.scoped(sep.join(["Index", generation]))
+        return _stores[key]
+
+    @classmethod
+    def name(cls, name: str, generation: str) -> str:
+        # feeds, leaderboards and counters of a generation (and their redis keys)
+        return f"{generation}.{name}" if generation else name
+
+
+class WordCampaignIndex:
+    """inverted word index, one posting list document per word
+
+    indexing a campaign only rewrites the documents of its own words and a
+    lookup only decodes the words asked for. documents are spread over 256
+    folders by the md5 of the word, which also keeps any word a valid file name
+    """
+
+    version: int = 3  # 3: a document per word, 2 was WORD_INDEX_SHARDS shards
+
+    @classmethod
+    def build_path(cls, word: str) -> str:
+        digest = md5(word.encode()).hexdigest()
+        return sep.join([cls.__name__, digest[0:2], f"{digest}.json"])
+
+    @classmethod
+    def load(
+        cls, word: str, use_cache: bool = True, generation: Optional[str] = None
+    ) -> PostingList:
+        return cls._load(word, use_cache=use_cache, generation=generation)[0]
+
+    @classmethod
+    def _load(
+        cls, word: str, use_cache: bool = True, generation: Optional[str] = None
+    ) -> Tuple[PostingList, Dict[str, int]]:
+        # the postings, and the live writes made while the generation was built
+        store = IndexGeneration.store(IndexGeneration.resolve(generation))
+        data = store.read_document_or_none(cls.build_path(word), use_cache=use_cache)
+        if not data or data.get("version") != cls.version:
+            return PostingList(), {}
+        return PostingList.decode(data["postings"]), data.get("live", {})
+
+    @classmethod
+    def save(
+        cls,
+        word: str,
+        postings: PostingList,
+        generation: str,
+        live: Optional[Dict[str, int]] = None,
+    ):
+        store = IndexGeneration.store(generation)
+        if not postings and not live:
+            store.rm_if_exists(cls.build_path(word))
+            return
+        doc = dict(version=cls.version, word=word, postings=postings.encode())
+        if live:
+            doc["live"] = live
+        store.write_document(cls.build_path(word), doc)
+
+    @classmethod
+    def update_word(
+        cls,
+        word: str,
+        changes: Dict[str, int],
+        generation: str,
+        building: bool = False,
+        merge: bool = False,
+    ):
+        """applies {campaign_id: frequency} to a word, a frequency of 0 removes
+
+        building records the changes as live writes to a generation being
+        built, they win over the reindex runs: a merge skips the campaigns
+        with a live write, whatever their run holds can only be as new
+        """
+        with IndexGeneration.store(generation).lock(cls.build_path(word)):
+            postings, live = cls._load(word, use_cache=False, generation=generation)
+            changed = False
+            for campaign_id, frequency in changes.items():
+                if merge and campaign_id in live:
+                    continue
+                if building and live.get(campaign_id) != frequency:
+                    # 0 is kept too, a tombstone for the removed word
+                    live[campaign_id] = frequency
+                    changed = True
+                if frequency:
+                    changed |= postings.add(campaign_id, frequency=frequency)
+                else:
+                    changed |= postings.remove(campaign_id)
+            if changed:
+                cls.save(word, postings, generation, live=live)
+
+    @classmethod
+    def retrieve_ids(cls, word: str) -> List[str]:
+        return list(cls.load(word))
+
+    @classmethod
+    def retrieve_postings(cls, words: Iterable[str]) -> Dict[str, PostingList]:
+        # one GET per word
+        generation = IndexGeneration.current()
+        return {word: cls.load(word, generation=generation) for word in set(words)}
+
+
+class WordIndexBuild:
+    """builds the word index of a new generation with one writer per word
+
+    batches of campaigns write their postings as runs, split into
+    REINDEX_WORD_BUCKETS buckets by word. then one job per bucket merges the
+    bucket's runs into its word documents. rerunning either step is harmless:
+    a run is overwritten and a merge re-applies the same frequencies
+    """
+
+    @classmethod
+    def bucket(cls, word: str) -> int:
+        digest = md5(word.encode()).hexdigest()
+        return int(digest[0:8], 16) % config.REINDEX_WORD_BUCKETS
+
+    @classmethod
+    def runs_path(cls, generation: str, bucket: int = None) -> str:
+        parts = ["Reindex", generation, "runs"]
+        if bucket is not None:
+            parts.append(f"{bucket:03}")
+        return sep.join(parts)
+
+    @classmethod
+    def write_runs(
+        cls, generation: str, run: str, campaign_words: Dict[str, Dict[str, int]]
+    ):
+        """writes {campaign id: {word: frequency}} as the run named run"""
+        buckets: Dict[int, Dict[str, Dict[str, int]]] = {}
+        for campaign_id, words in campaign_words.items():
+            for word, frequency in words.items():
+                bucket = buckets.setdefault(cls.bucket(word), {})
+                bucket.setdefault(word, {})[campaign_id] = frequency
+        list(
+            index_write_pool.map(
+                lambda x: datamgr.write_document(
+                    sep.join([cls.runs_path(generation, x[0]), f"{run}.json"]),
+                    dict(words=x[1]),
+                ),
+                buckets.items(),
+            )
+        )
+
+    @classmethod
+    def merge_bucket(cls, generation: str, bucket: int) -> int:
+        """merges the runs of a bucket into the word documents, returns the words"""
+        path = cls.runs_path(generation, bucket)
+        try:
+            runs = datamgr.ls(path)
+        except ListPathException:
+            runs = []
+        words: Dict[str, Dict[str, int]] = {}
+        for run in runs:
+            doc = datamgr.read_document_or_none(sep.join([path, run]), use_cache=False)
+            for word, frequencies in (doc or {}).get("words", {}).items():
+                words.setdefault(word, {}).update(frequencies)
+        # live writes to the generation lock the same documents, so merge into them
+        list(
+            index_write_pool.map(
+                lambda x: WordCampaignIndex.update_word(
+                    x[0], x[1], generation, merge=True
+                ),
+                words.items(),
+            )
+        )
+        datamgr.rm_if_exists(path)
+        return len(words)
+
+
+def campaign_progress(campaign: Campaign) -> float:
+    return campaign.amount_reached / max(1, campaign.goal)
+
+
+class CampaignBestIndex:
+    """leaderboards of the best campaigns, one per metric"""
+
+    metrics: Dict[str, Callable[[Campaign], float]] = {
+        "amount": lambda campaign: campaign.amount_reached,
+        "progress": campaign_progress,
+    }
+
+    @classmethod
+    def board_name(cls, metric: str) -> str:
+        return f"{cls.__name__}-{metric}"
 
-class CampaignBestIndex(Index):
-    target_model_name: str = "BestCampaigns"
 
+class CampaignWorstIndex(CampaignBestIndex):
+    """campaigns furthest from their goal (the negated progress is the score)"""
 
-class CampaignWorstIndex(Index):
-    target_model_name: str = "WorstCampaigns"
+    metrics: Dict[str, Callable[[Campaign], float]] = {
+        "progress": lambda campaign: -campaign_progress(campaign),
+    }
 
 
-class LatestCampaignIndex(Index):
-    target_model_name: str = "LatestCampaigns"
+class InvalidSearchCursorException(Exception):
+    pass
+
+
+class IndexWriteBatch:
+    """collects index writes and flushes them deduplicated and concurrently
+
+        with IndexWriteBatch() as batch:
+            batch.touch(path)
+            batch.add_words(campaign_id, {"word": 2})
+
+    for the same path (or word/campaign pair) the last write wins. nothing is
+    written if the block raises. writes go to every generation being written
+    (see IndexGeneration) unless generations are given
+    """
+
+    def __init__(self, generations: List[str] = None):
+        self.generations = generations
+        self.paths: Dict[str, bool] = {}  # path -> True to touch, False to delete
+        # word -> {campaign id: frequency, 0 to remove}
+        self.words: Dict[str, Dict[str, int]] = {}
+        # campaign id -> score to add to the latest feed, None to remove
+        self.latest: Dict[str, float] = {}
+        # leaderboard name -> {campaign id: score or None to remove}
+        self.leaderboards: Dict[str, Dict[str, Optional[float]]] = {}
+        # category id -> {campaign id: score or None to remove}
+        self.categories: Dict[str, Dict[str, Optional[float]]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def touch(self, path: str):
+        self.paths[path] = True
+
+    def delete(self, path: str):
+        self.paths[path] = False
+
+    def add_words(self, campaign_id: str, words: Dict[str, int]):
+        for word, frequency in words.items():
+            self._set_word(word, campaign_id, frequency)
+
+    def remove_words(self, campaign_id: str, words: Iterable[str]):
+        for word in words:
+            self._set_word(word, campaign_id, 0)
+
+    def _set_word(self, word: str, campaign_id: str, frequency: int):
+        self.words.setdefault(word, {})[campaign_id] = frequency
+
+    def add_latest(self, campaign_id: str, score: float = None):
+        self.latest[campaign_id] = time.time() if score is None else score
+
+    def remove_latest(self, campaign_id: str):
+        self.latest[campaign_id] = None
+
+    def rank(self, leaderboard: str, campaign_id: str, score: Optional[float]):
+        self.leaderboards.setdefault(leaderboard, {})[campaign_id] = score
+
+    def add_category(self, category_id: str, campaign_id: str, score: float = None):
+        score = time.time() if score is None else score
+        self.categories.setdefault(str(category_id), {})[campaign_id] = score
+
+    def remove_category(self, category_id: str, campaign_id: str):
+        self.categories.setdefault(str(category_id), {})[campaign_id] = None
+
+    def flush(self):
+        jobs = []
+        for generation in self.generations or IndexGeneration.writable():
+            jobs.extend(self._jobs(generation))
+        self.paths = {}
+        self.words = {}
+        self.latest = {}
+        self.leaderboards = {}
+        self.categories = {}
+        if not jobs:
+            return
+        if len(jobs) == 1:
+            jobs[0][0](*jobs[0][1])
+            return
+        # list() so the first failure is raised here
+        list(index_write_pool.map(lambda job: job[0](*job[1]), jobs))
+
+    def _jobs(self, generation: str) -> List[Tuple[Callable, tuple]]:
+        store = IndexGeneration.store(generation)
+        latest_feed = IndexManager.latest_feed(generation)
+        jobs = [
+            (latest_feed.remove, (campaign_id,))
+            if score is None
+            else (latest_feed.append, (campaign_id, score))
+            for campaign_id, score in self.latest.items()
+        ]
+        jobs.extend(
+            [
+                (IndexManager.touch if touch else IndexManager.delete, (path, store))
+                for path, touch in self.paths.items()
+            ]
+        )
+        # live writes to a generation being built are recorded for its merge
+        doc = IndexGeneration.read()
+        building = (
+            self.generations is None
+            and generation != doc["current"]
+            and generation == doc["building"]
+        )
+        jobs.extend(
+            [
+                (WordCampaignIndex.update_word, (word, changes, generation, building))
+                for word, changes in self.words.items()
+            ]
+        )
+        jobs.extend(
+            [
+                (IndexManager.leaderboard(name, generation).update, (scores,))
+                for name, scores in self.leaderboards.items()
+            ]
+        )
+        if self.categories:
+            # one job so the counters are adjusted in a single write
+            jobs.append(
+                (IndexManager.update_categories, (self.categories, generation))
+            )
+        return jobs
+
+
+class SearchEngine:
+    """ranked multi-term search over the word index
+
+    results are ordered by number of matched terms, then by summed term frequency,
+    then by id. pages are addressed by an opaque cursor holding the sort key of
+    the last result so only the campaigns on the page need to be loaded
+    """
+
+    @classmethod
+    def encode_cursor(cls, key: Tuple[int, int, str]) -> str:
+        return urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> Tuple[int, int, str]:
+        try:
+            matched, frequency, oid = json.loads(urlsafe_b64decode(cursor.encode()))
+            return (int(matched), int(frequency), str(oid))
+        except Exception as exp:
+            raise InvalidSearchCursorException(f"Invalid cursor {cursor} (exp: {exp})")
+
+    @classmethod
+    def search(
+        cls, terms: List[str], mode: str = "and", page_size: int = 20, cursor: str = ""
+    ) -> Tuple[List[str], str]:
+        """returns a page of campaign ids and the cursor of the next page ('' if last)
+
+        mode 'and' only matches campaigns containing every term, 'or' any term
+        """
+        if mode not in ["and", "or"]:
+            raise InvalidIndexArgumentException(f"Unknown search mode {mode}")
+        words = list(set(IndexManager.clean_words(terms)))
+        if not words:
+            return [], ""
+        postings = WordCampaignIndex.retrieve_postings(words)
+
+        if mode == "and":
+            # intersect starting from the shortest posting list
+            ordered = sorted(postings.values(), key=len)
+            candidates = set(ordered[0])
+            for posting_list in ordered[1:]:
+                candidates.intersection_update(posting_list)
+        else:
+            candidates = set().union(*postings.values())
+
+        after = cls.decode_cursor(cursor) if cursor else None
+
+        def _keys():
+            for oid in candidates:
+                matched = [x for x in postings.values() if oid in x]
+                frequency = sum([x.frequency(oid) for x in matched])
+                # negated so that the smallest keys are the best results
+                key = (-len(matched), -frequency, oid)
+                if after is None or key > after:
+                    yield key
+
+        # only the page (and one more to tell if there is a next) is ordered,
+        # not every candidate
+        page = heapq.nsmallest(page_size + 1, _keys())
+        next_cursor = ""
+        if len(page) > page_size:
+            next_cursor = cls.encode_cursor(page[page_size - 1])
+        return [x[2] for x in page[0:page_size]], next_cursor
 
 
 class IndexManager:
+    # store defaults to the root of the data manager (eg: the user indexes),
+    # campaign indexes pass the store of their generation
+
     @staticmethod
-    def touch(path: str, ttl: str = ""):
-        datamgr.put(path=path, obj=StringIO(""), ttl=ttl)
+    def touch(path: str, store: DataManager = None, ttl: str = ""):
+        store = store or datamgr
+        # the local file system doesn't create parents on write
+        store.mkdir(sep.join(path.split(sep)[0:-1]))
+        store.put(path=path, obj=StringIO(""), ttl=ttl)
 
     @staticmethod
-    def delete(path: str):
-        if datamgr.exists(path):
-            datamgr.rm(path=path)
+    def delete(path: str, store: DataManager = None):
+        (store or datamgr).rm_if_exists(path=path)
 
     @staticmethod
-    def retrieve_ids(path: str) -> List[str]:
+    def retrieve_ids(path: str, store: DataManager = None) -> List[str]:
         # ls returns id files with extension so we strip the extension
         # before sending the id
-        if not datamgr.exists(path):
+        try:
+            ids = (store or datamgr).ls(path)
+        except ListPathException:
+            # a missing index path is an empty index
             return []
-        ids = datamgr.ls(path)
         if not ids:
             return []
         return [x.split(".")[0] for x in ids]
 
     @classmethod
-    def update_campaign_indicies(cls, campaign: Campaign):
-        # user/campaign
-        cls.touch(
-            path=UserCampaignIndex.build_path(
-                ref_id=campaign.user_id, target_id=campaign.id
-            )
+    def campaign_index_digest(cls, campaign: Campaign) -> str:
+        # hash of every field an index is built from
+        return md5(
+            json.dumps(
+                [
+                    campaign.title,
+                    campaign.description,
+                    campaign.user_id,
+                    campaign.category_id,
+                ]
+            ).encode()
+        ).hexdigest()
+
+    @classmethod
+    def campaign_words(cls, campaign: Campaign) -> Dict[str, int]:
+        return Counter(
+            tokenizer.iter_tokens(" ".join([campaign.title, campaign.description]))
         )
 
-        cls.touch(
-            path=CategoryCampaignIndex.build_path(
-                ref_id=campaign.category_id,
-                target_id=campaign.id,
-            )
+    @classmethod
+    def update_campaign_indicies(
+        cls,
+        campaign: Campaign,
+        batch: IndexWriteBatch = None,
+        score: float = None,
+        words: bool = True,
+    ):
+        """score orders the campaign in the latest/category feeds, defaults to now
+
+        words=False leaves out the word index (a reindex builds it with WordIndexBuild)
+        """
+        if batch is None:
+            with IndexWriteBatch() as batch:
+                return cls.update_campaign_indicies(
+                    campaign, batch=batch, score=score, words=words
+                )
+
+        # user/campaign
+        batch.touch(
+            UserCampaignIndex.build_path(ref_id=campaign.user_id, target_id=campaign.id)
         )
 
+        batch.add_category(campaign.category_id, campaign.id, score=score)
+
         # add to latest campaigns
-        cls.create_latest_campaign_index(campaign_id=campaign.id)
+        batch.add_latest(campaign.id, score=score)
 
         # full word index
-        for word in cls.clean_words(
-            list(set((campaign.title + campaign.description).split()))
-        ):
-            cls.create_word_campaign_index(word=word, campaign_id=campaign.id)
+        if words:
+            batch.add_words(campaign.id, cls.campaign_words(campaign))
 
     @classmethod
-    def clean_words(cls, words: List[str], language: str = "english") -> List[str]:
-        stop_words = stopwords.words(language)
+    def reindex_campaign(
+        cls, campaign: Campaign, batch: IndexWriteBatch = None, words: bool = True
+    ):
+        """rebuilds every index entry of a stored campaign, feeds are ordered by
+        the campaign's created time so a rebuild keeps them newest-first
+        """
+        if batch is None:
+            with IndexWriteBatch() as batch:
+                return cls.reindex_campaign(campaign, batch=batch, words=words)
+        score = arrow.get(campaign.created).timestamp() if campaign.created else None
+        cls.update_campaign_indicies(campaign, batch=batch, score=score, words=words)
+        cls.update_campaign_leaderboards(campaign, batch=batch)
 
-        res = []
-        # remove stop words and words < 3 char and covert to lowercase
-        for word in [x.lower() for x in words if x and len(x) > 2]:
-            # remove puncuation
-            word = "".join([x for x in word if x not in punctuation])
-            if word in stop_words:
-                continue
-            res.append(word)
-        return res
+    @classmethod
+    def clean_words(cls, words: List[str], language: str = "english") -> List[str]:
+        return tokenizer.clean_words(words, language=language)
 
     @classmethod
     def retrieve_campaign_ids_by_user_id(cls, user_id: str) -> List[str]:
-        return cls.retrieve_ids(UserCampaignIndex.build_path(ref_id=user_id))
+        return cls.retrieve_ids(
+            UserCampaignIndex.build_path(ref_id=user_id),
+            store=IndexGeneration.store(IndexGeneration.current()),
+        )
 
     @classmethod
-    def retrieve_campaign_ids_by_category(
-        cls, category_id: str, subcategory_id: str
-    ) -> List[str]:
+    def retrieve_campaign_ids_by_category(cls, category_id: str) -> List[str]:
         return cls.retrieve_ids(
-            CategoryCampaignIndex.build_path(
-                ref_id=subcategory_id, category_id=category_id
-            )
+            CategoryCampaignIndex.build_path(ref_id=str(category_id)),
+            store=IndexGeneration.store(IndexGeneration.current()),
         )
 
     @classmethod
-    def delete_campaign_indicies(cls, campaign: Campaign):
-        # user/campaign
-        cls.delete(
-            path=UserCampaignIndex.build_path(
-                ref_id=campaign.user_id, target_id=campaign.id
-            )
+    def category_feed(cls, category_id: str, generation: Optional[str] = None) -> Feed:
+        generation = IndexGeneration.resolve(generation)
+        return get_feed(
+            IndexGeneration.name(
+                CategoryCampaignIndex.feed_name(category_id), generation
+            ),
+            capacity=config.CATEGORY_FEED_SIZE,
+            datamgr=IndexGeneration.store(generation),
         )
 
-        cls.delete(
-            path=CategoryCampaignIndex.build_path(
-                ref_id=campaign.category_id,
-                target_id=campaign.id,
-            )
+    @classmethod
+    def retrieve_category_campaign_ids_page(
+        cls, category_id: str, limit: int, cursor: str = ""
+    ) -> Tuple[List[str], str]:
+        return cls.category_feed(category_id).page(limit, cursor=cursor)
+
+    @classmethod
+    def category_counters(cls, generation: Optional[str] = None) -> Counters:
+        generation = IndexGeneration.resolve(generation)
+        return get_counters(
+            IndexGeneration.name("category", generation),
+            datamgr=IndexGeneration.store(generation),
+            path=CategoryCampaignIndex.summary_path,
         )
 
+    @classmethod
+    def retrieve_category_counts(cls) -> Dict[str, int]:
+        """category id -> number of campaigns, one read for every category"""
+        return cls.category_counters().read()
+
+    @classmethod
+    def update_categories(
+        cls, changes: Dict[str, Dict[str, Optional[float]]], generation: str = None
+    ):
+        """applies {category id: {campaign id: score or None to remove}}
+
+        the membership marker decides whether a campaign is new to (or gone
+        from) a category, so repeated adds/removes don't skew the counts. the
+        markers of a category are checked and set under its lock, the feed and
+        the counters are only written after that lock is released
+        """
+        generation = IndexGeneration.resolve(generation)
+        store = IndexGeneration.store(generation)
+        deltas = {}
+        for category_id, campaigns in changes.items():
+            delta = 0
+            with store.lock(CategoryCampaignIndex.build_path(ref_id=category_id)):
+                for campaign_id, score in campaigns.items():
+                    path = CategoryCampaignIndex.build_path(
+                        ref_id=category_id, target_id=campaign_id
+                    )
+                    if score is None:
+                        if store.rm_if_exists(path):
+                            delta -= 1
+                    elif not store.exists(path):
+                        cls.touch(path, store=store)
+                        delta += 1
+            if delta:
+                deltas[category_id] = delta
+
+            feed = cls.category_feed(category_id, generation)
+            for campaign_id, score in campaigns.items():
+                if score is None:
+                    feed.remove(campaign_id)
+                else:
+                    # no-op if already in the feed
+                    feed.append(campaign_id, score)
+        if deltas:
+            cls.category_counters(generation).incr(deltas)
+
+    @classmethod
+    def delete_campaign_indicies(cls, campaign: Campaign, batch: IndexWriteBatch = None):
+        if batch is None:
+            with IndexWriteBatch() as batch:
+                return cls.delete_campaign_indicies(campaign, batch=batch)
+
+        # user/campaign
+        batch.delete(
+            UserCampaignIndex.build_path(ref_id=campaign.user_id, target_id=campaign.id)
+        )
+
+        batch.remove_category(campaign.category_id, campaign.id)
+
         # delete from latest campaign index
-        cls.delete_latest_campaign_index(campaign_id=campaign.id)
+        batch.remove_latest(campaign.id)
 
         # delete from best/worst
-        cls.delete_campaign_best_index(campaign_id=campaign.id)
-        cls.delete_campaign_worst_index(campaign_id=campaign.id)
+        for index in [CampaignBestIndex, CampaignWorstIndex]:
+            for metric in index.metrics:
+                batch.rank(index.board_name(metric), campaign.id, None)
+
+        batch.delete(ActiveCampaignIndex.build_campaign_path(campaign.id))
 
         # delete all word indicies
-        for word in list(set((campaign.title + campaign.description).split())):
-            cls.delete_word_campaign_id(word=word, campaign_id=campaign.id)
+        batch.remove_words(campaign.id, cls.campaign_words(campaign))
+
+    @classmethod
+    def leaderboard(cls, name: str, generation: Optional[str] = None) -> Leaderboard:
+        generation = IndexGeneration.resolve(generation)
+        return get_leaderboard(
+            IndexGeneration.name(name, generation),
+            capacity=config.LEADERBOARD_SIZE,
+            datamgr=IndexGeneration.store(generation),
+        )
+
+    @classmethod
+    def campaign_leaderboard_key(cls, campaign: Campaign) -> str:
+        # the leaderboard scores only depend on these
+        return f"{campaign.amount_reached}/{campaign.goal}"
+
+    @classmethod
+    def update_campaign_leaderboards(
+        cls,
+        campaign: Campaign,
+        batch: IndexWriteBatch = None,
+        previous_key: Optional[str] = None,
+    ):
+        """previous_key is the campaign_leaderboard_key the entries were last
+        written for, the active marker is only written when it crosses the goal.
+        None writes it regardless (eg: in a reindex)
+        """
+        if batch is None:
+            with IndexWriteBatch() as batch:
+                return cls.update_campaign_leaderboards(
+                    campaign, batch=batch, previous_key=previous_key
+                )
+        for index in [CampaignBestIndex, CampaignWorstIndex]:
+            for metric, score in index.metrics.items():
+                batch.rank(index.board_name(metric), campaign.id, score(campaign))
+        active = campaign.amount_reached < campaign.goal
+        if (
+            previous_key is not None
+            and cls.leaderboard_key_active(previous_key) == active
+        ):
+            return
+        if active:
+            batch.touch(ActiveCampaignIndex.build_campaign_path(campaign.id))
+        else:
+            batch.delete(ActiveCampaignIndex.build_campaign_path(campaign.id))
+
+    @classmethod
+    def leaderboard_key_active(cls, leaderboard_key: str) -> Optional[bool]:
+        # whether the campaign was below its goal, None for no (or a bad) key
+        try:
+            amount, goal = leaderboard_key.split("/")
+            return int(amount) < int(goal)
+        except ValueError:
+            return None
+
+    @classmethod
+    def iter_active_campaign_ids(cls) -> Iterator[str]:
+        """streams the ids of the campaigns below their goal, a bucket at a time"""
+        store = IndexGeneration.store(IndexGeneration.current())
+        buckets = cls.retrieve_ids(ActiveCampaignIndex.__name__, store=store)
+        for bucket in sorted(buckets):
+            yield from cls.retrieve_ids(
+                ActiveCampaignIndex.build_path(ref_id=bucket), store=store
+            )
+
+    @classmethod
+    def retrieve_best_campaign_ids(cls, metric: str = "amount", limit: int = 25):
+        return cls._retrieve_leaderboard_ids(CampaignBestIndex, metric, limit)
+
+    @classmethod
+    def retrieve_worst_campaign_ids(cls, metric: str = "progress", limit: int = 25):
+        return cls._retrieve_leaderboard_ids(CampaignWorstIndex, metric, limit)
+
+    @classmethod
+    def _retrieve_leaderboard_ids(cls, index, metric: str, limit: int) -> List[str]:
+        if metric not in index.metrics:
+            raise InvalidIndexArgumentException(
+                f"Unknown metric {metric} for {index.__name__}"
+            )
+        return [x[1] for x in cls.leaderboard(index.board_name(metric)).read(limit)]
 
     @classmethod
     def delete_campaign_best_index(cls, campaign_id: str):
-        cls.delete(CampaignBestIndex.build_path(ref_id=campaign_id))
+        with IndexWriteBatch() as batch:
+            for metric in CampaignBestIndex.metrics:
+                batch.rank(CampaignBestIndex.board_name(metric), campaign_id, None)
 
     @classmethod
     def delete_campaign_worst_index(cls, campaign_id: str):
-        cls.delete(CampaignWorstIndex.build_path(ref_id=campaign_id))
+        with IndexWriteBatch() as batch:
+            for metric in CampaignWorstIndex.metrics:
+                batch.rank(CampaignWorstIndex.board_name(metric), campaign_id, None)
 
     @classmethod
     def retrieve_user_ids_by_email(cls, email: str) -> List[str]:
@@ -242,38 +919,62 @@ class IndexManager:
         _word = _word[0]
         if not _word:
             return []
-        return cls.retrieve_ids(WordCampaignIndex.build_path(ref_id=_word))
-
-    @classmethod
-    def delete_word_campaign_id(cls, word: str, campaign_id: str):
-        ids = cls.retrieve_word_campaign_ids(word=word)
-        if campaign_id in ids:
-            cls.delete(
-                path=WordCampaignIndex.build_path(ref_id=word, target_id=campaign_id)
-            )
+        return WordCampaignIndex.retrieve_ids(_word)
 
     @classmethod
-    def create_word_campaign_index(cls, word: str, campaign_id: str):
-        cls.touch(WordCampaignIndex.build_path(ref_id=word, target_id=campaign_id))
+    def latest_feed(cls, generation: Optional[str] = None) -> Feed:
+        generation = IndexGeneration.resolve(generation)
+        return get_feed(
+            IndexGeneration.name("latest", generation),
+            capacity=config.MAX_LATEST_COUNT,
+            datamgr=IndexGeneration.store(generation),
+        )
 
     @classmethod
-    def retrieve_lastest_campaign_index_ids(cls):
-        return cls.retrieve_ids(LatestCampaignIndex.build_path(ref_id="latest"))
+    def retrieve_latest_campaign_ids_page(
+        cls, limit: int, cursor: str = ""
+    ) -> Tuple[List[str], str]:
+        return cls.latest_feed().page(limit, cursor=cursor)
 
     @classmethod
     def delete_latest_campaign_index(cls, campaign_id: str):
-        cls.delete(
-            path=LatestCampaignIndex.build_path(ref_id="latest", target_id=campaign_id)
-        )
+        with IndexWriteBatch() as batch:
+            batch.remove_latest(campaign_id)
 
     @classmethod
     def create_latest_campaign_index(cls, campaign_id: str):
-        current_ids = cls.retrieve_lastest_campaign_index_ids()
-        if campaign_id in current_ids:  # don't create if already exists
+        with IndexWriteBatch() as batch:
+            batch.add_latest(campaign_id)
+
+    @classmethod
+    def drop_generation(cls, generation: str):
+        """removes the campaign indexes of a generation that is not served or built"""
+        doc = IndexGeneration.read(use_cache=False)
+        if generation == doc["current"] or (
+            doc["building"] and generation == doc["building"]
+        ):
+            raise InvalidIndexArgumentException(
+                f"Generation {generation} is in use and can't be dropped"
+            )
+        # feeds, leaderboards and counters may be in redis, not the store
+        counters = cls.category_counters(generation)
+        for category_id in counters.read():
+            cls.category_feed(category_id, generation).clear()
+        cls.latest_feed(generation).clear()
+        for index in [CampaignBestIndex, CampaignWorstIndex]:
+            for metric in index.metrics:
+                cls.leaderboard(index.board_name(metric), generation).clear()
+        counters.clear()
+        if generation:
+            datamgr.rm_if_exists(sep.join(["Index", generation]))
+            datamgr.rm_if_exists(sep.join(["Reindex", generation]))
             return
-        while len(current_ids) > config.MAX_LATEST_COUNT:
-            earliest_campaign_id = current_ids.pop(0)
-            cls.delete_latest_campaign_index(earliest_campaign_id)
-        cls.touch(
-            path=LatestCampaignIndex.build_path(ref_id="latest", target_id=campaign_id)
-        )
+        for index in [
+            UserCampaignIndex,
+            CategoryCampaignIndex,
+            WordCampaignIndex,
+            ActiveCampaignIndex,
+        ]:
+            datamgr.rm_if_exists(index.__name__)
+        for folder in ["Feed", "Leaderboard", "Counters"]:
+            datamgr.rm_if_exists(folder)
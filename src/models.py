@@ -1,7 +1,7 @@
 import os
 import time
-from typing import Any, Dict, List, Tuple
-from pydantic import BaseModel, validator
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple, Type
+from pydantic import BaseModel, Field, validator
 import arrow
 from config import config
 from utils import gen_random
@@ -13,12 +13,31 @@ class ValidationErrorLength(Exception):
     pass
 
 
+class UnknownModelException(Exception):
+    pass
+
+
+# model_name -> model class, filled in as the models are defined (see
+# Base0.__init_subclass__) so a stored document's model_name picks its class
+model_registry: Dict[str, Type["Base0"]] = {}
+
+
+def get_model_type(model_name: str) -> Type["Base0"]:
+    if model_name not in model_registry:
+        raise UnknownModelException(f"No model named '{model_name}'")
+    return model_registry[model_name]
+
+
 class Base0(BaseModel):
     id: str = ""
     created: str = ""
     modified: str = ""
     model_name: str = ""
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        model_registry[cls.__name__] = cls
+
     @classmethod
     def _utc_now(cls):
         return str(arrow.utcnow()).replace("-", "").replace(":", "").split(".")[0]
@@ -41,12 +60,39 @@ class Base0(BaseModel):
     def set_modified(cls, val):
         return cls._utc_now()
 
+    @classmethod
+    def from_storage(cls, data: Dict[str, Any]):
+        """builds the model from a document we stored, skipping validation
+
+        stored documents were validated when they were saved, and re-running
+        the validators would reset id/created/modified. use the constructor
+        for user input. nested models with a from_storage of their own (eg:
+        ContributionRing) are built with it, unknown keys are dropped
+        """
+        values = {}
+        for name, field in cls.__fields__.items():
+            if name not in data:
+                continue
+            value = data[name]
+            if (
+                value is not None
+                and hasattr(field.type_, "from_storage")
+                and not isinstance(value, field.type_)
+            ):
+                value = field.type_.from_storage(value)
+            values[name] = value
+        return cls.construct(**values)
+
     def dict(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
         result = super().dict(*args, **kwargs)
         result["model_name"] = self.__class__.__name__
         self.model_name = result["model_name"]
         return result
 
+    # the documents a model is stored as: its own data.json first, the fields
+    # of later ones override it when loaded (see Campaign)
+    document_filenames: ClassVar[List[str]] = ["data.json"]
+
     def get_filename(self):
         return "data.json"
 
@@ -72,6 +118,10 @@ class Base0(BaseModel):
         # builds the full relative path including filename
         return sep.join([self.get_parent_path(), self.get_filename()])
 
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        # relative path -> document, for each of document_filenames
+        return {self.get_relative_path(): self.dict()}
+
     def get_ttl(self):
         return ""
 
@@ -92,11 +142,113 @@ class User(Base0):
     email: str
 
 
+class ContributionRing(BaseModel):
+    """the most recent contributions of a campaign in a fixed size ring
+
+    entries are stored as columns, appending overwrites the oldest slot. the
+    aggregates (count, total, top, first, last) cover every contribution ever
+    appended, so reading them never scans or sorts the entries. entries are
+    expected to be appended in date order
+    """
+
+    capacity: int = config.CONTRIBUTION_RING_SIZE
+    head: int = 0  # slot the next entry is written to
+    names: List[str] = []
+    amounts: List[int] = []
+    dates: List[str] = []
+    messages: List[str] = []
+    count: int = 0
+    total: int = 0
+    top: Optional[Dict[str, Any]] = None
+    first: Optional[Dict[str, Any]] = None
+    last: Optional[Dict[str, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def append(self, name: str, amount: int, date: str, message: str = ""):
+        if len(self.names) < self.capacity:
+            self.names.append(name)
+            self.amounts.append(amount)
+            self.dates.append(date)
+            self.messages.append(message)
+        else:
+            self.names[self.head] = name
+            self.amounts[self.head] = amount
+            self.dates[self.head] = date
+            self.messages[self.head] = message
+        self.head = (self.head + 1) % self.capacity
+
+        entry = dict(name=name, amount=amount, date=date, message=message)
+        self.count += 1
+        self.total += amount
+        if self.top is None or amount > self.top["amount"]:
+            self.top = entry
+        if self.first is None:
+            self.first = entry
+        self.last = entry
+
+    def extend(
+        self,
+        names: Iterable[str],
+        amounts: Iterable[int],
+        dates: Iterable[str],
+        messages: Iterable[str],
+    ):
+        for name, amount, date, message in zip(names, amounts, dates, messages):
+            self.append(name, amount, date, message)
+
+    def entry(self, i: int) -> Dict[str, Any]:
+        return dict(
+            name=self.names[i],
+            amount=self.amounts[i],
+            date=self.dates[i],
+            message=self.messages[i],
+        )
+
+    def recent(self, limit: int = 0) -> List[Dict[str, Any]]:
+        """newest first"""
+        size = len(self.names)
+        limit = min(limit or size, size)
+        return [self.entry((self.head - 1 - i) % size) for i in range(limit)]
+
+    def with_messages(self, limit: int = 0) -> List[Dict[str, Any]]:
+        """newest first, only the entries with a message"""
+        size = len(self.names)
+        res = []
+        for i in range(size):
+            j = (self.head - 1 - i) % size
+            if self.messages[j]:
+                res.append(self.entry(j))
+                if len(res) == limit:
+                    break
+        return res
+
+    @classmethod
+    def from_storage(cls, value: Any) -> "ContributionRing":
+        # see Base0.from_storage
+        if isinstance(value, list):
+            return cls.from_list(value)
+        return cls.construct(**{x: y for x, y in value.items() if x in cls.__fields__})
+
+    @classmethod
+    def from_list(cls, contributions: List[Dict[str, Any]]) -> "ContributionRing":
+        ring = cls()
+        for x in sorted(contributions, key=lambda x: x.get("date", "")):
+            ring.append(
+                x.get("name", "Anonymous"),
+                int(x.get("amount", 0)),
+                x.get("date", ""),
+                x.get("message") or "",
+            )
+        return ring
+
+
 class Campaign(Base0):
     title: str
     description: str
     user_id: str
-    contributions: List[Dict[str, Any]] = []
+    contributions: ContributionRing = Field(default_factory=ContributionRing)
     goal: int
     user_id: str
     category_id: str
@@ -104,12 +256,52 @@ class Campaign(Base0):
     currency_code: str
     currency_symbol: str
     campaign_type_id: int
-    image_path: str = ""
+    image_path: str = ""  # legacy, uploads are stored by image_hash
+    image_hash: str = ""  # see images.py
     recipient: str = ""
     amount_reached: int = 0
     last_contribution_datetime: str = ""
     sentiment: str = ""
     contribution_count: int = 0
+    index_digest: str = ""  # see IndexManager.campaign_index_digest
+    leaderboard_key: str = ""  # see IndexManager.campaign_leaderboard_key
+    content_digest: str = ""  # see Crud.campaign_content_digest
+
+    @validator("contributions", pre=True)
+    def convert_contributions(cls, val):
+        # campaigns stored before the ring kept a plain list of dicts
+        if isinstance(val, list):
+            return ContributionRing.from_list(val)
+        return val
+
+    # fields that change with every contribution, stored in state.json apart
+    # from the rest of the campaign (the content) in data.json
+    state_fields: ClassVar[List[str]] = [
+        "amount_reached",
+        "contribution_count",
+        "last_contribution_datetime",
+        "contributions",
+        "leaderboard_key",
+        "modified",
+    ]
+    document_filenames: ClassVar[List[str]] = ["data.json", "state.json"]
+
+    @classmethod
+    def build_state_path(cls, oid: str) -> str:
+        return sep.join([cls.build_parent_path(oid), "state.json"])
+
+    def content_dict(self) -> Dict[str, Any]:
+        return {x: y for x, y in self.dict().items() if x not in self.state_fields}
+
+    def state_dict(self) -> Dict[str, Any]:
+        data = self.dict()
+        return {x: data[x] for x in self.state_fields}
+
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            self.get_relative_path(): self.content_dict(),
+            self.build_state_path(self.id): self.state_dict(),
+        }
 
 
 # used soley for display purposes, does not get persisted
@@ -120,6 +312,7 @@ class MiniCampaign(BaseModel):
     created: str
     progress: int
     amount_reached: int
+    image_hash: str = ""
 
     def __init__(self, campaign: Campaign):
         target_data = {
@@ -0,0 +1,93 @@
+# compact posting lists for the inverted word index
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# the shared prefix length is written as a single base 36 digit
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+MAX_SHARED_PREFIX = len(_DIGITS) - 1
+
+
+class PostingList:
+    """sorted, de-duplicated list of ids with a term frequency per id
+
+    encoded with front coding (the string version of delta encoding): every id
+    is written as the length of the prefix it shares with the previous id
+    followed by the rest of the id and, when it is not 1, ':<frequency>'.
+    entries are separated by a space
+    """
+
+    def __init__(
+        self, ids: Iterable[str] = (), frequencies: Optional[Dict[str, int]] = None
+    ):
+        self.ids: List[str] = sorted(set(ids))
+        self.frequencies: Dict[str, int] = {
+            k: v for k, v in (frequencies or {}).items() if v != 1
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __contains__(self, oid: str) -> bool:
+        index = bisect_left(self.ids, oid)
+        return index < len(self.ids) and self.ids[index] == oid
+
+    def frequency(self, oid: str) -> int:
+        return self.frequencies.get(oid, 1)
+
+    def add(self, *ids: str, frequency: int = 1) -> bool:
+        """returns True if the list changed"""
+        changed = False
+        for oid in ids:
+            index = bisect_left(self.ids, oid)
+            if index == len(self.ids) or self.ids[index] != oid:
+                # a new id with the default frequency is still a change
+                self.ids.insert(index, oid)
+                changed = True
+            if self.frequency(oid) != frequency:
+                changed = True
+                if frequency == 1:
+                    self.frequencies.pop(oid, None)
+                else:
+                    self.frequencies[oid] = frequency
+        return changed
+
+    def remove(self, *ids: str) -> bool:
+        """returns True if the list changed"""
+        removed = set(ids)
+        remaining = [x for x in self.ids if x not in removed]
+        changed = len(remaining) != len(self.ids)
+        self.ids = remaining
+        for oid in removed:
+            self.frequencies.pop(oid, None)
+        return changed
+
+    def encode(self) -> str:
+        res = []
+        previous = ""
+        for oid in self.ids:
+            shared = 0
+            limit = min(len(previous), len(oid), MAX_SHARED_PREFIX)
+            while shared < limit and previous[shared] == oid[shared]:
+                shared += 1
+            entry = _DIGITS[shared] + oid[shared:]
+            if oid in self.frequencies:
+                entry += f":{self.frequencies[oid]}"
+            res.append(entry)
+            previous = oid
+        return " ".join(res)
+
+    @classmethod
+    def decode(cls, data: str) -> "PostingList":
+        res = cls()
+        previous = ""
+        for entry in data.split(" ") if data else []:
+            entry, _, frequency = entry.partition(":")
+            oid = previous[0 : _DIGITS.index(entry[0])] + entry[1:]
+            res.ids.append(oid)  # already sorted and unique
+            if frequency:
+                res.frequencies[oid] = int(frequency)
+            previous = oid
+        return res
@@ -0,0 +1,59 @@
+# static support data (countries, categories, etc), loaded once per process
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from config import config
+
+
+class UnknownReferenceDataException(Exception):
+    pass
+
+
+class ReferenceData:
+    # name -> config attribute holding the path of the json file
+    sources: Dict[str, str] = {
+        "country_currency": "COUNTRY_CURRENCY_DATA",
+        "categories": "CATEGORIES_DATA",
+        "campaign_types": "CAMPAIGN_TYPES_DATA",
+        "donation_distribution": "DONATION_DISTRIBUTION_DATA",
+        "first_names": "FIRST_NAMES_DATA",
+        "message_bank": "MESSAGE_BANK_DATA",
+    }
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._indexes: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name: str) -> Any:
+        if name not in self.sources:
+            raise UnknownReferenceDataException(f"No reference data named {name}")
+        with open(getattr(config, self.sources[name])) as f:
+            return json.load(f)
+
+    def get(self, name: str) -> Any:
+        # lazy so a process only reads the files it actually uses
+        if name not in self._data:
+            with self._lock:
+                if name not in self._data:
+                    self._data[name] = self._load(name)
+        return self._data[name]
+
+    def by_id(self, name: str, oid: int) -> Optional[Dict[str, Any]]:
+        """O(1) lookup of a record by its 'id' field"""
+        index = self._indexes.get(name)
+        if index is None:
+            index = {x.get("id"): x for x in self.get(name)}
+            self._indexes[name] = index
+        return index.get(oid)
+
+    def reload(self, name: str = ""):
+        # drops cached data (all of it if no name is given), it will be re-read on next use
+        with self._lock:
+            for key in [name] if name else list(self._data.keys()):
+                self._data.pop(key, None)
+                self._indexes.pop(key, None)
+
+
+reference_data = ReferenceData()
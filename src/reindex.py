@@ -0,0 +1,166 @@
+# rebuilds the word, user, category, latest and leaderboard indexes from the
+# stored campaigns into a fresh index generation, then serves it
+#
+#   python reindex.py               # fan batches out to the celery workers
+#   python reindex.py --local       # index in this process
+#   python reindex.py --restart     # ignore the checkpoint, build a new generation
+#   python reindex.py --drop <gen>  # remove a generation that is no longer served
+#
+# build: campaigns are streamed one partition folder at a time and indexed in
+#   batches into the new generation. their words are only written as runs
+#   (see indexing.WordIndexBuild)
+# merge: one job per word bucket merges the runs into the word documents, so
+#   every word document has a single writer
+# swap: the new generation is served. the replaced one, with any entries that
+#   had gone stale in it, is left for --drop
+#
+# index writes made while a generation is built go to it as well (see
+# indexing.IndexGeneration), a partition is checkpointed once all its batches
+# are indexed so a crashed run resumes after the last finished partition
+import argparse
+import logging
+import time
+from typing import List
+
+import arrow
+from celery import group
+
+from config import config
+from crud import Crud, datamgr
+from data_manager import sep
+from indexing import IndexGeneration, IndexManager
+from tasks import merge_word_bucket, reindex_campaigns
+
+CHECKPOINT_PATH = sep.join(["Reindex", "checkpoint.json"])
+
+
+def load_checkpoint() -> dict:
+    return datamgr.read_document_or_none(CHECKPOINT_PATH, use_cache=False)
+
+
+def new_checkpoint() -> dict:
+    generation = arrow.utcnow().format("YYYYMMDDHHmmss")
+    replaced = IndexGeneration.start_build(generation)
+    if replaced:
+        logging.info(
+            f"Abandoned the build of generation {replaced}, drop it with --drop"
+        )
+    # processes still caching the old pointer must see the build before it
+    # starts, else their writes would miss it
+    time.sleep(config.INDEX_GENERATION_TTL_SECONDS)
+    return dict(
+        generation=generation, phase="build", partition="", campaigns=0, seconds=0.0
+    )
+
+
+def index_partition(
+    generation: str, partition: str, campaign_ids: List[str], local: bool
+) -> int:
+    batches = [
+        (
+            campaign_ids[i : i + config.REINDEX_BATCH_SIZE],
+            f"{partition.replace(sep, '-')}-{i}",
+        )
+        for i in range(0, len(campaign_ids), config.REINDEX_BATCH_SIZE)
+    ]
+    if local:
+        return sum(
+            [
+                reindex_campaigns(campaign_ids=x, generation=generation, run=y)
+                for x, y in batches
+            ]
+        )
+    # wait for the whole partition before it can be checkpointed
+    res = group(
+        [
+            reindex_campaigns.s(campaign_ids=x, generation=generation, run=y)
+            for x, y in batches
+        ]
+    ).apply_async()
+    return sum(res.get())
+
+
+def merge_words(generation: str, local: bool) -> int:
+    buckets = range(config.REINDEX_WORD_BUCKETS)
+    if local:
+        return sum(
+            [merge_word_bucket(generation=generation, bucket=x) for x in buckets]
+        )
+    res = group(
+        [merge_word_bucket.s(generation=generation, bucket=x) for x in buckets]
+    ).apply_async()
+    return sum(res.get())
+
+
+def reindex(local: bool = False, restart: bool = False):
+    checkpoint = None if restart else load_checkpoint()
+    building = IndexGeneration.read(use_cache=False)["building"]
+    if checkpoint and checkpoint.get("generation") != building:
+        logging.info(f"Generation {checkpoint.get('generation')} is no longer built")
+        checkpoint = None
+    if checkpoint:
+        logging.info(
+            f"Resuming generation {checkpoint['generation']} ({checkpoint['phase']}) "
+            f"after partition {checkpoint['partition']}"
+        )
+    else:
+        checkpoint = new_checkpoint()
+        datamgr.write_document(CHECKPOINT_PATH, checkpoint)
+    generation = checkpoint["generation"]
+
+    if checkpoint["phase"] == "build":
+        for partition, campaign_ids in Crud.iter_campaign_partitions(
+            after=checkpoint["partition"]
+        ):
+            started = time.monotonic()
+            count = (
+                index_partition(generation, partition, campaign_ids, local=local)
+                if campaign_ids
+                else 0
+            )
+            elapsed = time.monotonic() - started
+
+            checkpoint["partition"] = partition
+            checkpoint["campaigns"] += count
+            checkpoint["seconds"] += elapsed
+            datamgr.write_document(CHECKPOINT_PATH, checkpoint)
+            logging.info(
+                f"{partition}: {count} campaigns ({count / max(elapsed, 1e-6):.1f}/sec), "
+                f"{checkpoint['campaigns']} total "
+                f"({checkpoint['campaigns'] / max(checkpoint['seconds'], 1e-6):.1f}/sec)"
+            )
+        checkpoint["phase"] = "merge"
+        datamgr.write_document(CHECKPOINT_PATH, checkpoint)
+
+    started = time.monotonic()
+    words = merge_words(generation, local=local)
+    checkpoint["seconds"] += time.monotonic() - started
+    logging.info(f"Merged {words} words in {time.monotonic() - started:.1f}s")
+
+    replaced = IndexGeneration.swap(generation)
+    datamgr.rm_if_exists(sep.join(["Reindex", generation]))
+    # done: the next run starts from the beginning
+    datamgr.rm_if_exists(CHECKPOINT_PATH)
+    logging.info(
+        f"Reindexed {checkpoint['campaigns']} campaigns in {checkpoint['seconds']:.1f}s "
+        f"into generation {generation}, drop the replaced generation "
+        f"with --drop '{replaced}'"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the campaign indexes")
+    parser.add_argument("--local", action="store_true", help="index in this process")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    parser.add_argument(
+        "--drop",
+        metavar="GENERATION",
+        help="remove an index generation ('' for the first)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.drop is not None:
+        IndexManager.drop_generation(args.drop)
+        logging.info(f"Dropped index generation '{args.drop}'")
+    else:
+        reindex(local=args.local, restart=args.restart)
@@ -3,8 +3,6 @@ from functools import wraps
 import json
 from datetime import datetime
 import logging
-import random
-from string import ascii_uppercase
 import textwrap
 import time
 from typing import List
@@ -18,6 +16,7 @@ from flask import (
     send_file,
     abort,
     jsonify,
+    make_response,
 )
 from jinja2 import environment
 import arrow
@@ -34,16 +33,19 @@ from forms import (
     DonationForm,
     SearchForm,
 )
-from crud import Crud
-from indexing import IndexManager
-from models import Campaign, User, MiniCampaign
-from tasks import index_post_words, get_campaign_sentiment
-from utils import is_image_file, is_explicit_content, scrub_explicit
-
-FIRST_NAMES = Crud.retrieve_first_names()
-MESSAGE_BANK = Crud.retrieve_message_bank()
-DONATION_DISTRIBUTION = Crud.retreive_donation_distribution()
-
+from crud import Crud, NoCategoryExistsException
+import images
+from feeds import InvalidFeedCursorException
+from indexing import (
+    IndexManager,
+    InvalidIndexArgumentException,
+    InvalidSearchCursorException,
+    SearchEngine,
+)
+from models import Campaign, ContributionRing, User, MiniCampaign
+from simulation import populate_contributions
+from tasks import generate_image_variants, get_campaign_sentiment
+from utils import date_to_string, is_image_file, is_explicit_content, scrub_explicit
 
 # ##############
 # jinja2 filters
@@ -56,12 +58,14 @@ def time_since(dt):
 
 
 def contributions_with_messages(contributions):
-    res = sorted(
-        [x for x in contributions if x.get("message")],
-        key=lambda x: x.get("date"),
-        reverse=True,
-    )
-    return res[0:25]
+    return contributions.with_messages(limit=25)
+
+
+def campaign_image_url(campaign, size="full"):
+    # straight to the immutable variant when there is one, saves a redirect
+    if campaign.image_hash:
+        return url_for("get_image", image_hash=campaign.image_hash, size=size)
+    return url_for("get_campaign_image", campaign_id=campaign.id)
 
 
 def separate_number(number):
@@ -83,6 +87,7 @@ def separate_number(number):
 app.jinja_env.filters["time_since"] = time_since
 app.jinja_env.filters["contributions_with_messages"] = contributions_with_messages
 app.jinja_env.filters["separate_number"] = separate_number
+app.jinja_env.filters["campaign_image_url"] = campaign_image_url
 
 
 def login_required(func):
@@ -281,7 +286,8 @@ def create_campaign():
         campaign = Campaign(**kwargs)
         Crud.update_campaign(campaign, img=img)
 
-        index_post_words.delay(campaign_id=campaign.id)
+        if img:
+            generate_image_variants.delay(image_hash=campaign.image_hash)
         get_campaign_sentiment.delay(campaign_id=campaign.id)
 
         return redirect(url_for("get_campaign", campaign_id=campaign.id))
@@ -289,84 +295,12 @@ def create_campaign():
     return render_template("onboard/step4.html", form=form)
 
 
-def date_to_string(date):
-    return str(date).replace("-", "").replace(":", "").split(".")[0]
-
-
-def populate_contributions(campaign: Campaign):
-    """artifically populated contributions"""
-    goal = campaign.goal
-
-    n = max(
-        1, int(goal / config.DIVISOR_UPDATES_PER_TIME_PERIOD)
-    )  # number of updates per time period
-    p = config.UPDATE_TIME_PERIOD_IN_MINUTES  # update time period in minutes
-    updates = []
-
-    anchor = arrow.get(campaign.created, tzinfo="utc")
-    if campaign.last_contribution_datetime:
-        anchor = arrow.get(campaign.last_contribution_datetime, tzinfo="utc")
-
-    if not campaign.sentiment:
-        campaign.sentiment = "neutral"
-    anchor = anchor.shift(minutes=random.randrange(p * 0.2, p))
-    utc_now = arrow.utcnow()
-    # calculate the contribution slots
-    contribution_slots = []
-    while anchor < utc_now:
-        contrib_count = random.randrange(0, n)
-        for i in range(0, contrib_count):
-            contribution_slots.append(anchor)
-        anchor = anchor.shift(minutes=random.randrange(p * 0.2, p))
-
-    this_run_amount = 0
-    total_contribution_slots_count = len(contribution_slots)
-
-    if total_contribution_slots_count < 1:
-        # no updates, just return
+def simulate_contributions_on_read(*campaigns: Campaign):
+    # when simulation runs as a scheduled task, views are pure reads
+    if not config.SIMULATE_CONTRIBUTIONS_ON_READ:
         return
-
-    if total_contribution_slots_count < 100:
-        campaign.contributions = campaign.contributions[
-            -100 - total_contribution_slots_count :
-        ]
-    else:
-        campaign.contributions = []
-
-    # just update the last slots
-    for anchor in contribution_slots[-100:]:
-        name = (
-            "Anonymous"
-            if random.random() < config.ANONYMOUS_POST_PERCENT
-            else f"{random.choice(FIRST_NAMES)} {random.choice(ascii_uppercase)}."
-        )
-        message = ""
-        if random.random() < config.MESSAGE_POST_PERCENT:
-            message = random.choice(MESSAGE_BANK.get(campaign.sentiment))
-        amount = random.choice(DONATION_DISTRIBUTION)
-        this_run_amount += amount
-        campaign.amount_reached += amount
-        campaign.contributions.append(
-            dict(
-                name=name,
-                amount=amount,
-                date=str(anchor),
-                message=message,
-            )
-        )
-
-    # artifically adjust for amount increase
-    if total_contribution_slots_count > 100:
-        avg_amount = int(this_run_amount / 100)
-        unfulfilled_slots = total_contribution_slots_count - 100
-        campaign.amount_reached += avg_amount * unfulfilled_slots
-
-    campaign.contribution_count += total_contribution_slots_count
-
-    campaign.last_contribution_datetime = date_to_string(
-        str(anchor if anchor < arrow.utcnow() else arrow.utcnow())
-    )
-    Crud.update_campaign(campaign=campaign)
+    for campaign in campaigns:
+        populate_contributions(campaign=campaign)
 
 
 @app.route("/campaign/<string:campaign_id>", methods=["GET"])
@@ -378,30 +312,19 @@ def get_campaign(campaign_id: str):
         )
 
     # artifically populate contributions
-    populate_contributions(campaign=campaign)
+    simulate_contributions_on_read(campaign)
 
     category_name = Crud.retrieve_category_name(category_id=campaign.category_id)
     cc = Crud.retrieve_country_currency(country_id=campaign.country_id)
-    top_contribution = first_contribution = last_contribution = None
-    if campaign.contributions:
-        top_contribution = sorted(
-            campaign.contributions, key=lambda x: x.get("amount")
-        )[-1]
-        contributions_date_sorted = sorted(
-            campaign.contributions, key=lambda x: x.get("date")
-        )
-        first_contribution = contributions_date_sorted[0]
-        last_contribution = contributions_date_sorted[-1]
-
     return render_template(
         "campaign.html",
         campaign=campaign,
         category_name=category_name,
         currency_symbol=campaign.currency_symbol or "$",
         progress=100 * min(1, campaign.amount_reached / max(1, campaign.goal)),
-        top_contribution=top_contribution,
-        first_contribution=first_contribution,
-        last_contribution=last_contribution,
+        top_contribution=campaign.contributions.top,
+        first_contribution=campaign.contributions.first,
+        last_contribution=campaign.contributions.last,
     )
 
 
@@ -416,13 +339,22 @@ def donate(campaign_id):
     form = DonationForm(request.form)
     if form.validate_on_submit():
         contribution = dict(
-            message=form.message.data,
+            message=form.message.data or "",
             amount=form.amount.data,
             name=form.donor.data if not form.anonymous.data else "Anonymous",
             date=date_to_string(arrow.utcnow()),
         )
-        campaign.contributions.append(contribution)
-        Crud.update_campaign(campaign)
+        # the cached copy may be behind, the donation is added to the stored one
+        with Crud.campaign_for_update(campaign_id) as campaign:
+            if campaign is None:
+                # deleted since it was shown
+                abort(404)
+            campaign.contributions.append(**contribution)
+            campaign.amount_reached += contribution["amount"]
+            campaign.contribution_count += 1
+            # the simulation resumes from the donation
+            campaign.last_contribution_datetime = contribution["date"]
+            Crud.update_campaign(campaign)
         return redirect(url_for("get_campaign", campaign_id=campaign.id))
 
     if "user_first_name" in session and "user_last_name" in session:
@@ -466,7 +398,10 @@ def signup():
 
 @app.route("/img/campaign/<string:campaign_id>")
 def get_campaign_image(campaign_id):
+    size = request.args.get("size", "full")
     campaign = Crud.retrieve_campaign(campaign_id)
+    if campaign and campaign.image_hash:
+        return redirect(url_for("get_image", image_hash=campaign.image_hash, size=size))
     if not campaign or not campaign.image_path:
         return redirect(
             url_for("show_asset_image", filename="campaign-placeholder.png")
@@ -474,36 +409,171 @@ def get_campaign_image(campaign_id):
     return send_file(Crud.retrieve_image(campaign.image_path), mimetype="image/png")
 
 
+@app.route("/img/<string:image_hash>/<string:size>")
+def get_image(image_hash, size):
+    if not images.is_image_hash(image_hash) or size not in images.SIZES:
+        abort(404)
+    accepted = [x for x, q in request.accept_mimetypes if q > 0]
+    fmt = images.negotiate_format(accepted)
+    try:
+        raw = images.get_variant(image_hash, size, fmt)
+    except images.InvalidImageException as exp:
+        logging.error(f"Could not serve image {image_hash}/{size} - {exp}")
+        abort(404)
+
+    # the url names the content, so the response never changes for a format
+    rsp = make_response(raw)
+    rsp.mimetype = images.MIMETYPES[fmt]
+    rsp.set_etag(f"{image_hash}-{size}-{fmt}")
+    rsp.cache_control.public = True
+    rsp.cache_control.max_age = config.IMAGE_CACHE_MAX_AGE_SECONDS
+    rsp.cache_control.immutable = True
+    rsp.vary.add("Accept")
+    return rsp.make_conditional(request)
+
+
 @app.route("/search", methods=["GET", "POST"])
 def search():
     form = SearchForm(request.form)
     campaigns = []
+    next_url = None
+    # later pages are plain GETs carrying the terms and the cursor
+    terms = request.args.get("q", "")
+    mode = request.args.get("mode", "and")
+    cursor = request.args.get("cursor", "")
     if form.validate_on_submit():
-        search_terms = form.terms.data.split()
-
-        campaign_ids = []
-        for word in search_terms:
-            campaign_ids.extend(IndexManager.retrieve_word_campaign_ids(word=word))
-        campaign_ids = list(set(campaign_ids))[0:100]
-        campaigns = [y for y in [Crud.retrieve_campaign(x) for x in campaign_ids] if y]
-        if campaigns:
-            campaigns = sorted(
-                campaigns, key=lambda x: x.last_contribution_datetime, reverse=True
+        terms = form.terms.data
+        mode = form.mode.data
+        cursor = ""
+    elif terms:
+        form.terms.data = terms
+        form.mode.data = mode
+
+    if terms:
+        try:
+            campaign_ids, next_cursor = SearchEngine.search(
+                terms.split(),
+                mode=mode,
+                page_size=config.SEARCH_PAGE_SIZE,
+                cursor=cursor,
             )
-            for campaign in campaigns:
-                populate_contributions(campaign=campaign)
-    return render_template("campaigns.html", form=form, campaigns=campaigns)
+        except (InvalidSearchCursorException, InvalidIndexArgumentException) as exp:
+            logging.error(f"Invalid search request - {exp}")
+            abort(400, "Invalid search request")
+        campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+        simulate_contributions_on_read(*campaigns)
+        if next_cursor:
+            next_url = url_for("search", q=terms, mode=mode, cursor=next_cursor)
+    return render_template(
+        "campaigns.html", form=form, campaigns=campaigns, next_url=next_url
+    )
 
 
 @app.route("/latest", methods=["GET"])
 def latest():
-    campaign_ids = IndexManager.retrieve_lastest_campaign_index_ids()[0:25]
-    campaigns = [Crud.retrieve_campaign(x) for x in campaign_ids]
-    for campaign in campaigns:
-        populate_contributions(campaign=campaign)
-    form = None
+    try:
+        campaign_ids, next_cursor = IndexManager.retrieve_latest_campaign_ids_page(
+            limit=config.LATEST_PAGE_SIZE, cursor=request.args.get("before", "")
+        )
+    except InvalidFeedCursorException as exp:
+        logging.error(f"Invalid latest request - {exp}")
+        abort(400, "Invalid cursor")
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    simulate_contributions_on_read(*campaigns)
+    next_url = url_for("latest", before=next_cursor) if next_cursor else None
     return render_template(
-        "campaigns.html", form=None, campaigns=campaigns, page_title="Latest"
+        "campaigns.html",
+        form=None,
+        campaigns=campaigns,
+        page_title="Latest",
+        next_url=next_url,
+    )
+
+
+@app.route("/categories", methods=["GET"])
+def categories():
+    counts = IndexManager.retrieve_category_counts()
+    category_counts = [
+        (x, counts.get(str(x["id"]), 0))
+        for x in sorted(Crud.retreive_categories(), key=lambda x: x["name"])
+    ]
+    return render_template(
+        "categories.html", category_counts=category_counts, page_title="Categories"
+    )
+
+
+@app.route("/category/<int:category_id>", methods=["GET"])
+def category(category_id):
+    try:
+        category_name = Crud.retrieve_category_name(category_id=category_id)
+    except NoCategoryExistsException:
+        return render_template(
+            "4xx.html", message=f"A category with id {category_id} does not exist"
+        )
+    try:
+        campaign_ids, next_cursor = IndexManager.retrieve_category_campaign_ids_page(
+            category_id,
+            limit=config.CATEGORY_PAGE_SIZE,
+            cursor=request.args.get("before", ""),
+        )
+    except InvalidFeedCursorException as exp:
+        logging.error(f"Invalid category request - {exp}")
+        abort(400, "Invalid cursor")
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    simulate_contributions_on_read(*campaigns)
+    next_url = (
+        url_for("category", category_id=category_id, before=next_cursor)
+        if next_cursor
+        else None
+    )
+    note = None
+    if not next_cursor:
+        # the feed only pages through the newest CATEGORY_FEED_SIZE campaigns
+        count = IndexManager.retrieve_category_counts().get(str(category_id), 0)
+        if count > config.CATEGORY_FEED_SIZE:
+            note = f"Showing the newest {config.CATEGORY_FEED_SIZE} of {count} campaigns"
+    return render_template(
+        "campaigns.html",
+        form=None,
+        campaigns=campaigns,
+        page_title=category_name,
+        next_url=next_url,
+        note=note,
+    )
+
+
+@app.route("/best", methods=["GET"])
+def best():
+    metric = request.args.get("by", "amount")
+    try:
+        campaign_ids = IndexManager.retrieve_best_campaign_ids(
+            metric=metric, limit=config.LATEST_PAGE_SIZE
+        )
+    except InvalidIndexArgumentException as exp:
+        logging.error(f"Invalid best request - {exp}")
+        abort(400, "Invalid metric")
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    simulate_contributions_on_read(*campaigns)
+    return render_template(
+        "campaigns.html",
+        form=None,
+        campaigns=campaigns,
+        page_title="Top Campaigns",
+    )
+
+
+@app.route("/worst", methods=["GET"])
+def worst():
+    campaign_ids = IndexManager.retrieve_worst_campaign_ids(
+        limit=config.LATEST_PAGE_SIZE
+    )
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    simulate_contributions_on_read(*campaigns)
+    return render_template(
+        "campaigns.html",
+        form=None,
+        campaigns=campaigns,
+        page_title="Campaigns Needing Support",
     )
 
 
@@ -511,9 +581,8 @@ def latest():
 @login_required
 def my_campaigns():
     campaign_ids = IndexManager.retrieve_campaign_ids_by_user_id(session["user_id"])
-    campaigns = [Crud.retrieve_campaign(x) for x in campaign_ids]
-    for campaign in campaigns:
-        populate_contributions(campaign=campaign)
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    simulate_contributions_on_read(*campaigns)
     minified_campaigns = sorted(
         [MiniCampaign(x) for x in campaigns],
         key=lambda x: x.created,
@@ -532,10 +601,8 @@ def my_campaigns():
 def fix_campaign(campaign_id):
     operation = request.args.get("operation", default=None)
     campaign = Crud.retrieve_campaign(campaign_id=campaign_id)
-    if operation == "scrub_contributions":
-        campaign.contributions = []
-        campaign.last_contribution_datetime = campaign.created
-
+    if campaign is None:
+        abort(404)
     if operation == "stats":
         return jsonify(dict(contribution_count=len(campaign.contributions)))
 
@@ -543,10 +610,21 @@ def fix_campaign(campaign_id):
         Crud.delete_campaign(campaign_id=campaign.id)
         return "ok"
 
-    Crud.update_campaign(campaign)
+    with Crud.campaign_for_update(campaign_id) as campaign:
+        if campaign is None:
+            abort(404)
+        if operation == "scrub_contributions":
+            campaign.contributions = ContributionRing()
+            campaign.last_contribution_datetime = campaign.created
+        Crud.update_campaign(campaign)
     return "ok"
 
 
+@app.route("/api/stats/cache")
+def cache_stats():
+    return jsonify(Crud.cache_stats())
+
+
 # @app.route("")
 
 # @app.route("/img/<path:path>")
@@ -0,0 +1,95 @@
+# encodes/decodes stored documents (models, indexes, feeds)
+#
+# documents are written with the codec named by config.DOCUMENT_CODEC and read
+# with whichever codec wrote them, so switching codecs never strands existing
+# documents: json (stdlib or orjson) always starts with an ascii character,
+# msgpack maps/arrays never do
+import json
+from typing import Any, Dict, Union
+
+from config import config
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, pip install msgpack
+    msgpack = None
+
+
+class UnknownCodecException(Exception):
+    pass
+
+
+class Codec:
+    name: str = ""
+
+    def dumps(self, data: Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, raw: bytes) -> Any:
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=str)
+
+    def loads(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False)
+
+
+codecs: Dict[str, Codec] = {
+    JsonCodec.name: JsonCodec(),
+    OrjsonCodec.name: OrjsonCodec(),
+    MsgpackCodec.name: MsgpackCodec(),
+}
+_available = dict(json=True, orjson=orjson is not None, msgpack=msgpack is not None)
+
+
+def get_codec(name: str = "") -> Codec:
+    name = name or config.DOCUMENT_CODEC
+    if name not in codecs:
+        raise UnknownCodecException(f"Unknown codec {name} (one of {list(codecs)})")
+    if not _available[name]:
+        raise UnknownCodecException(f"Codec {name} needs the {name} package installed")
+    return codecs[name]
+
+
+def encode(data: Any, codec: str = "") -> bytes:
+    return get_codec(codec).dumps(data)
+
+
+def decode(raw: Union[bytes, str]) -> Any:
+    if isinstance(raw, str):
+        raw = raw.encode()
+    stripped = raw.lstrip()
+    if stripped and stripped[0] >= 0x80:
+        return get_codec(MsgpackCodec.name).loads(raw)
+    # orjson parses any json, including the indented documents of old saves
+    return codecs[OrjsonCodec.name if orjson else JsonCodec.name].loads(raw)
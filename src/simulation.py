@@ -0,0 +1,224 @@
+# artificial contribution simulation (see "Update algorithm" in the readme)
+from collections import deque
+import math
+import random
+from string import ascii_uppercase
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import arrow
+import numpy as np
+
+from config import config
+from crud import Crud
+from models import Campaign
+from utils import date_to_string
+
+# idle intervals spanning more update periods than this are sampled, not walked
+EXACT_WALK_MAX_PERIODS = 1000
+
+
+def _period_bounds(p: int) -> Tuple[int, int]:
+    # update periods are a random number of whole minutes in [low, high)
+    low = max(1, int(p * 0.2))
+    return low, max(low + 1, p)
+
+
+def walk_contribution_slots(
+    start: int,
+    end: int,
+    n: int,
+    p: int,
+    keep: int = config.CONTRIBUTION_RING_SIZE,
+) -> Tuple[int, List[int]]:
+    """walks (start, end) one update period at a time
+
+    start/end are unix timestamps, n bounds the contributions per period and p is
+    the update period in minutes. returns the total number of contribution slots
+    and the timestamps of the last `keep` slots (ascending)
+    """
+    low, high = _period_bounds(p)
+    slots = deque(maxlen=keep)
+    count = 0
+    anchor = start + random.randrange(low, high) * 60
+    while anchor < end:
+        contrib_count = random.randrange(0, n)
+        if contrib_count:
+            count += contrib_count
+            slots.extend([anchor] * contrib_count)
+        anchor += random.randrange(low, high) * 60
+    return count, list(slots)
+
+
+def sample_contribution_slots(
+    start: int,
+    end: int,
+    n: int,
+    p: int,
+    keep: int = config.CONTRIBUTION_RING_SIZE,
+) -> Tuple[int, List[int]]:
+    """same result as walk_contribution_slots with work independent of (end - start)
+
+    the last `keep` slots are generated exactly by walking back from end, the
+    count for the rest of the interval is drawn from the normal approximation of
+    the number of periods (a renewal process) and of the contributions per period
+    """
+    if n <= 1:
+        # randrange(0, 1) never yields a contribution
+        return 0, []
+    low, high = _period_bounds(p)
+    period_mean = (low + high - 1) / 2
+    period_var = ((high - low) ** 2 - 1) / 12
+    if (end - start) / 60 / period_mean <= EXACT_WALK_MAX_PERIODS:
+        return walk_contribution_slots(start, end, n, p, keep=keep)
+
+    # walk backwards from end until enough slots are materialized
+    tail = []
+    anchor = end - random.randrange(0, high * 60)
+    while len(tail) < keep and anchor > start:
+        tail.extend([anchor] * random.randrange(0, n))
+        anchor -= random.randrange(low, high) * 60
+    count = len(tail)
+
+    # sample the number of slots in what is left of the interval
+    remaining = max(0, anchor - start) / 60
+    if remaining:
+        periods = random.gauss(
+            remaining / period_mean, math.sqrt(remaining * period_var / period_mean**3)
+        )
+        periods = max(0, round(periods))
+        slots_mean = periods * (n - 1) / 2
+        slots_std = math.sqrt(periods * (n * n - 1) / 12)
+        count += max(0, round(random.gauss(slots_mean, slots_std)))
+
+    return count, sorted(tail[:keep])
+
+
+class ContributionGenerator:
+    """draws whole batches of simulated contributions with numpy
+
+    the name, message and donation tables are built once so a batch of any size
+    is a handful of vectorized draws. pass a seed for reproducible output
+    """
+
+    def __init__(
+        self,
+        first_names: List[str],
+        message_bank: Dict[str, List[str]],
+        donation_distribution: List[int],
+        seed: Optional[int] = None,
+    ):
+        self.rng = np.random.default_rng(seed)
+        self.amounts = np.asarray(donation_distribution, dtype=np.int64)
+        self.names = np.asarray(
+            [f"{x} {y}." for x in first_names for y in ascii_uppercase]
+        )
+        self.messages = {k: np.asarray(v) for k, v in message_bank.items() if v}
+
+    def generate(self, count: int, sentiment: str = "neutral") -> Dict[str, np.ndarray]:
+        """returns columns (name, amount, message) of count contributions"""
+        rng = self.rng
+        amounts = rng.choice(self.amounts, size=count)
+        anonymous = rng.random(count) < config.ANONYMOUS_POST_PERCENT
+        names = np.where(anonymous, "Anonymous", rng.choice(self.names, size=count))
+        messages = np.full(count, "", dtype=object)
+        bank = self.messages.get(sentiment, self.messages.get("neutral"))
+        if bank is not None:
+            with_message = rng.random(count) < config.MESSAGE_POST_PERCENT
+            messages[with_message] = rng.choice(bank, size=int(with_message.sum()))
+        return dict(name=names, amount=amounts, message=messages)
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_contribution_generator() -> ContributionGenerator:
+    # built on first use so the support data is only read by processes that simulate
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = ContributionGenerator(
+                    first_names=Crud.retrieve_first_names(),
+                    message_bank=Crud.retrieve_message_bank(),
+                    donation_distribution=Crud.retreive_donation_distribution(),
+                )
+    return _generator
+
+
+def _contribution_slots(campaign: Campaign) -> Tuple[int, List[int]]:
+    # the contribution slots since the last contribution, see sample_contribution_slots
+    n = max(
+        1, int(campaign.goal / config.DIVISOR_UPDATES_PER_TIME_PERIOD)
+    )  # number of updates per time period
+    p = config.UPDATE_TIME_PERIOD_IN_MINUTES  # update time period in minutes
+
+    anchor = arrow.get(campaign.created, tzinfo="utc")
+    if campaign.last_contribution_datetime:
+        anchor = arrow.get(campaign.last_contribution_datetime, tzinfo="utc")
+
+    return sample_contribution_slots(
+        start=int(anchor.timestamp()),
+        end=int(arrow.utcnow().timestamp()),
+        n=n,
+        p=p,
+    )
+
+
+def populate_contributions(
+    campaign: Campaign, generator: Optional[ContributionGenerator] = None
+) -> bool:
+    """artifically populated contributions, returns True if the campaign was updated
+
+    campaign may be a cached copy: it only decides whether any contribution is
+    due. they are added to the stored campaign, under its lock, and the result
+    is copied back into campaign
+    """
+    total_contribution_slots_count, _ = _contribution_slots(campaign)
+    if total_contribution_slots_count < 1:
+        # no updates, just return
+        return False
+
+    with Crud.campaign_for_update(campaign.id) as stored:
+        if stored is None:
+            return False
+        # from the stored last contribution, another writer may have advanced it
+        total_contribution_slots_count, contribution_slots = _contribution_slots(stored)
+        if total_contribution_slots_count < 1:
+            return False
+        if not stored.sentiment:
+            stored.sentiment = "neutral"
+
+        # just update the last slots, the ring drops the oldest entries
+        generator = generator or get_contribution_generator()
+        columns = generator.generate(
+            len(contribution_slots), sentiment=stored.sentiment
+        )
+        this_run_amount = int(columns["amount"].sum())
+        stored.amount_reached += this_run_amount
+        stored.contributions.extend(
+            names=[str(x) for x in columns["name"]],
+            amounts=[int(x) for x in columns["amount"]],
+            dates=[str(arrow.get(x)) for x in contribution_slots],
+            messages=[str(x) for x in columns["message"]],
+        )
+        anchor = arrow.get(contribution_slots[-1])
+
+        # artifically adjust for amount increase, the slots the ring has no
+        # room for are counted at the average of the generated ones
+        unfulfilled_slots = total_contribution_slots_count - len(contribution_slots)
+        if unfulfilled_slots > 0:
+            avg_amount = int(this_run_amount / len(contribution_slots))
+            stored.amount_reached += avg_amount * unfulfilled_slots
+
+        stored.contribution_count += total_contribution_slots_count
+
+        stored.last_contribution_datetime = date_to_string(
+            str(anchor if anchor < arrow.utcnow() else arrow.utcnow())
+        )
+        Crud.update_campaign(campaign=stored)
+
+    for field, value in stored:
+        setattr(campaign, field, value)
+    return True
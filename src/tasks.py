@@ -1,29 +1,63 @@
 import logging
 import re
-from typing import Any, Dict
+from typing import Any, Dict, List
 from urllib.parse import quote
 
 from celery import Celery
 import requests
 
 from config import config
-from crud import Crud
-from indexing import IndexManager
+from crud import Crud, datamgr
+import images
+from indexing import IndexManager, IndexWriteBatch, WordIndexBuild
+from simulation import populate_contributions
+
+ADVANCE_CONTRIBUTIONS_LOCK_PATH = "advance_contributions"
 
 app = Celery("tasks", broker=config.CELERY_BROKER, backend=config.CELERY_BACKEND)
 
+if not config.SIMULATE_CONTRIBUTIONS_ON_READ:
+    app.conf.beat_schedule = {
+        "advance-contributions": {
+            "task": "tasks.advance_contributions",
+            "schedule": config.SIMULATION_INTERVAL_SECONDS,
+            # a tick still queued when the next one is due is dropped
+            "options": {"expires": config.SIMULATION_INTERVAL_SECONDS},
+        },
+    }
+
+
+@app.task
+def reindex_campaigns(campaign_ids: List[str], generation: str, run: str) -> int:
+    """indexes a batch into generation, its words are only written as a run"""
+    campaigns, missing_ids = Crud.retrieve_campaigns(campaign_ids, use_cache=False)
+    if missing_ids:
+        logging.warning(f"Skipping {len(missing_ids)} missing campaigns in reindex")
+    with IndexWriteBatch(generations=[generation]) as batch:
+        for campaign in campaigns:
+            IndexManager.reindex_campaign(campaign, batch=batch, words=False)
+    WordIndexBuild.write_runs(
+        generation, run, {x.id: IndexManager.campaign_words(x) for x in campaigns}
+    )
+    return len(campaigns)
+
 
 @app.task
-def index_post_words(campaign_id: str):
-    campaign = Crud.retrieve_campaign(campaign_id)
-    words = (campaign.title + campaign.description).split()
-    for word in cls.clean_words(words=words, language="english"):
-        IndexManager.create_word_campaign_index(word=word, campaign_id=campaign.id)
+def merge_word_bucket(generation: str, bucket: int) -> int:
+    return WordIndexBuild.merge_bucket(generation, bucket)
+
+
+@app.task
+def generate_image_variants(image_hash: str) -> int:
+    return images.generate_variants(image_hash)
 
 
 @app.task
 def get_campaign_sentiment(campaign_id):
-    campaign = Crud.retrieve_campaign(campaign_id)
+    campaign = Crud.retrieve_campaign(campaign_id, use_cache=False)
+    if campaign is None:
+        logging.error(f"Could not find campaign {campaign_id} for its sentiment")
+        return
     sentiment = None
     try:
         res = requests.get(
@@ -43,8 +77,64 @@ def get_campaign_sentiment(campaign_id):
         logging.error(f"Could not get sentiment for campaign {campaign_id} - {exp}")
         return
 
-    campaign.sentiment = sentiment
-    Crud.update_campaign(campaign=campaign)
+    # the lookup is slow, only the sentiment is set on the campaign as stored now
+    with Crud.campaign_for_update(campaign_id) as campaign:
+        if campaign is None:
+            # deleted during the lookup
+            return
+        campaign.sentiment = sentiment
+        Crud.update_campaign(campaign=campaign)
+
+
+@app.task
+def advance_contributions():
+    # fans the active campaigns out to batch tasks so workers can share the
+    # tick. skipped while another tick is still fanning out, the lease frees
+    # the lock of a crashed one by the next tick
+    lock = datamgr.lock(
+        ADVANCE_CONTRIBUTIONS_LOCK_PATH,
+        timeout=0,
+        lease_ms=config.SIMULATION_INTERVAL_SECONDS * 1000,
+    )
+    if not lock.acquire():
+        logging.info("Skipping advance_contributions, the previous run is active")
+        return 0
+    try:
+        batch = []
+        batches = 0
+        for campaign_id in IndexManager.iter_active_campaign_ids():
+            batch.append(campaign_id)
+            if len(batch) >= config.SIMULATION_BATCH_SIZE:
+                _advance_contributions_later(batch)
+                batches += 1
+                batch = []
+        if batch:
+            _advance_contributions_later(batch)
+            batches += 1
+        return batches
+    finally:
+        lock.release()
+
+
+def _advance_contributions_later(campaign_ids: List[str]):
+    # a batch the workers didn't get to before the next tick is redone by it
+    advance_contributions_batch.apply_async(
+        kwargs=dict(campaign_ids=campaign_ids),
+        expires=config.SIMULATION_INTERVAL_SECONDS,
+    )
+
+
+@app.task
+def advance_contributions_batch(campaign_ids: List[str]) -> int:
+    campaigns, _ = Crud.retrieve_campaigns(campaign_ids)
+    updated = 0
+    for campaign in campaigns:
+        try:
+            if populate_contributions(campaign=campaign):
+                updated += 1
+        except Exception as exp:
+            logging.error(f"Could not advance contributions for {campaign.id} - {exp}")
+    return updated
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+# turns campaign text into index terms
+from functools import lru_cache
+import json
+import re
+from string import punctuation
+from typing import FrozenSet, Iterable, Iterator, List
+
+from config import config
+
+_WORD_RE = re.compile(r"\S+")
+_STRIP_PUNCTUATION = str.maketrans("", "", punctuation)
+
+
+@lru_cache(maxsize=None)
+def stop_words(language: str = "english") -> FrozenSet[str]:
+    # read on first use (not at import) and once per language. the lists are
+    # nltk's stopwords corpus, shipped in support/ so no download is needed
+    with open(config.STOPWORDS_DATA) as f:
+        return frozenset(json.load(f)[language])
+
+
+def iter_clean_words(
+    words: Iterable[str], language: str = "english"
+) -> Iterator[str]:
+    """lowercases and strips punctuation, dropping stop words and words < 3 chars"""
+    _stop_words = stop_words(language)
+    for word in words:
+        if len(word) < 3:
+            continue
+        word = word.lower().translate(_STRIP_PUNCTUATION)
+        if word and word not in _stop_words:
+            yield word
+
+
+def iter_tokens(text: str, language: str = "english") -> Iterator[str]:
+    """streams the index terms of text without splitting it up front"""
+    return iter_clean_words(
+        (x.group(0) for x in _WORD_RE.finditer(text)), language=language
+    )
+
+
+def clean_words(words: Iterable[str], language: str = "english") -> List[str]:
+    return list(iter_clean_words(words, language=language))
@@ -25,6 +25,10 @@ def gen_random(length=None):
     return "".join(secrets.choice(chars) for _ in range(length))
 
 
+def date_to_string(date):
+    return str(date).replace("-", "").replace(":", "").split(".")[0]
+
+
 def is_image_file(obj: Any) -> bool:
     try:
         # Attempt to open the file as an image
@@ -0,0 +1,75 @@
+# save/load throughput and document size of a campaign with 100 contributions
+# for the legacy indented json and every installed codec
+import json
+import random
+import tempfile
+import timeit
+
+import arrow
+
+from config import config
+from data_manager import DataManager
+from file_systems import LocalFileSystem
+from models import Campaign, ContributionRing
+import serialization
+
+CONTRIBUTIONS = 100
+RUNS = 200
+
+
+def build_campaign() -> Campaign:
+    ring = ContributionRing()
+    now = arrow.utcnow()
+    for i in range(CONTRIBUTIONS):
+        ring.append(
+            name=f"Name{i} {chr(65 + i % 26)}.",
+            amount=random.choice([10, 25, 50, 100, 250]),
+            date=str(now.shift(minutes=i - CONTRIBUTIONS)),
+            message=random.choice(["", "Good luck!", "Rooting for you all the way"]),
+        )
+    return Campaign(
+        title="Help us rebuild the community garden",
+        description=" ".join(["lorem ipsum dolor sit amet"] * 150)[
+            0 : config.MAX_DESCRIPTION_LENGTH
+        ],
+        user_id="u" * 32,
+        goal=5000,
+        category_id="2",
+        country_id=1,
+        currency_code="USD",
+        currency_symbol="$",
+        campaign_type_id=1,
+        contributions=ring,
+        amount_reached=ring.total,
+        contribution_count=ring.count,
+    )
+
+
+def main():
+    campaign = build_campaign()
+    data = campaign.dict()
+
+    legacy = json.dumps(data, indent=4, default=str).encode()
+    print(f"campaign with {CONTRIBUTIONS} contributions, {RUNS} runs")
+    print(f"{'legacy json':>12}: {len(legacy):7d} bytes")
+
+    codecs = [x for x in serialization.codecs if serialization._available[x]]
+    with tempfile.TemporaryDirectory() as folder:
+        datamgr = DataManager(LocalFileSystem(), base_folder=folder)
+        for name in codecs:
+            raw = serialization.encode(data, codec=name)
+            assert serialization.decode(raw) == serialization.decode(legacy)
+            config.DOCUMENT_CODEC = name
+            path = campaign.get_relative_path()
+            save = timeit.timeit(lambda: datamgr.save(campaign), number=RUNS)
+            load = timeit.timeit(
+                lambda: datamgr.load(path, model_type=Campaign), number=RUNS
+            )
+            print(
+                f"{name:>12}: {len(raw):7d} bytes, "
+                f"save {RUNS / save:8.0f}/sec, load {RUNS / load:8.0f}/sec"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# compares the original arrow based slot walk with simulation.sample_contribution_slots
+# run with: make benchmark (or PYTHONPATH=src python tests/benchmarks/bench_contribution_slots.py)
+import random
+import timeit
+
+import arrow
+
+from simulation import sample_contribution_slots
+
+N = 5  # contributions per period bound, ie: a 5000 goal with the default divisor
+P = 100  # UPDATE_TIME_PERIOD_IN_MINUTES
+IDLE_DAYS = [1, 30, 365]
+
+
+def legacy_contribution_slots(anchor, utc_now, n, p):
+    # the loop populate_contributions used before the sampling engine
+    anchor = anchor.shift(minutes=random.randrange(int(p * 0.2), p))
+    contribution_slots = []
+    while anchor < utc_now:
+        contrib_count = random.randrange(0, n)
+        for i in range(0, contrib_count):
+            contribution_slots.append(anchor)
+        anchor = anchor.shift(minutes=random.randrange(int(p * 0.2), p))
+    return len(contribution_slots), contribution_slots[-100:]
+
+
+def main():
+    utc_now = arrow.utcnow()
+    print(f"{'idle':>8} {'legacy (ms)':>12} {'sampled (ms)':>13} {'speedup':>8}")
+    for days in IDLE_DAYS:
+        start = utc_now.shift(days=-days)
+        number = 3 if days > 30 else 20
+        legacy = timeit.timeit(
+            lambda: legacy_contribution_slots(start, utc_now, N, P), number=number
+        )
+        sampled = timeit.timeit(
+            lambda: sample_contribution_slots(
+                int(start.timestamp()), int(utc_now.timestamp()), N, P
+            ),
+            number=number,
+        )
+        legacy_ms = 1000 * legacy / number
+        sampled_ms = 1000 * sampled / number
+        print(
+            f"{days:>7}d {legacy_ms:>12.2f} {sampled_ms:>13.2f} {legacy_ms / sampled_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# builds a stored campaign (100 contributions) with full validation and with
+# the trusted Base0.from_storage path, per campaign and per /latest page
+import timeit
+
+from config import config
+from models import Campaign
+import serialization
+
+from bench_codecs import build_campaign
+
+RUNS = 500
+
+
+def main():
+    campaign = build_campaign()
+    # what a storage read hands to the model: the decoded document
+    data = serialization.decode(serialization.encode(campaign.dict()))
+
+    loaded = Campaign.from_storage(data)
+    assert loaded.dict() == campaign.dict()
+    assert (loaded.created, loaded.modified) == (data["created"], data["modified"])
+
+    validated = timeit.timeit(lambda: Campaign(**data), number=RUNS)
+    trusted = timeit.timeit(lambda: Campaign.from_storage(data), number=RUNS)
+    per_page = config.LATEST_PAGE_SIZE * 1000 / RUNS
+    print(f"campaign with {len(campaign.contributions)} contributions, {RUNS} runs")
+    print(f"Campaign(**data):      {validated * per_page:7.2f} ms per page of {config.LATEST_PAGE_SIZE}")
+    print(f"Campaign.from_storage: {trusted * per_page:7.2f} ms per page of {config.LATEST_PAGE_SIZE}")
+
+
+if __name__ == "__main__":
+    main()
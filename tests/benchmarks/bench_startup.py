@@ -0,0 +1,47 @@
+# measures the cold import cost of app.py (what every gunicorn worker pays on boot)
+import os
+import re
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+RUNS = 5
+TOP_MODULES = 15
+
+
+def import_app() -> str:
+    # a fresh interpreter per run so nothing is already imported
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=SRC,
+        env={**os.environ, "PYTHONPATH": SRC},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return res.stderr
+
+
+def main():
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        report = import_app()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"import app: median {1000 * timings[len(timings) // 2]:.0f} ms over {RUNS} runs")
+
+    # cumulative import time (us) per module from the last run
+    rows = []
+    for line in report.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(.*)$", line)
+        if match:
+            rows.append((int(match.group(1)), match.group(2).rstrip()))
+    print(f"slowest {TOP_MODULES} modules (cumulative):")
+    for cumulative, module in sorted(rows, reverse=True)[0:TOP_MODULES]:
+        print(f"{cumulative / 1000:10.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# compares the original IndexManager.clean_words with tokenizer.clean_words/iter_tokens
+# over descriptions of MAX_DESCRIPTION_LENGTH characters
+import json
+import random
+from string import punctuation
+import timeit
+
+from config import config
+import tokenizer
+
+DESCRIPTIONS = 200
+
+
+def legacy_clean_words(words, language="english"):
+    # IndexManager.clean_words before the tokenizer module
+    stop_words = list(tokenizer.stop_words(language))
+
+    res = []
+    for word in [x.lower() for x in words if x and len(x) > 2]:
+        word = "".join([x for x in word if x not in punctuation])
+        if word in stop_words:
+            continue
+        res.append(word)
+    return res
+
+
+def build_corpus():
+    # realistic text: the message bank, shuffled and cut to the max description length
+    with open(config.MESSAGE_BANK_DATA) as f:
+        words = " ".join([" ".join(x) for x in json.load(f).values()]).split()
+    corpus = []
+    for _ in range(DESCRIPTIONS):
+        random.shuffle(words)
+        corpus.append(" ".join(words)[0 : config.MAX_DESCRIPTION_LENGTH])
+    return corpus
+
+
+def main():
+    corpus = build_corpus()
+    # same terms, apart from the empty strings the legacy version emitted
+    assert [[y for y in legacy_clean_words(x.split()) if y] for x in corpus] == [
+        tokenizer.clean_words(x.split()) for x in corpus
+    ]
+    legacy = timeit.timeit(
+        lambda: [legacy_clean_words(x.split()) for x in corpus], number=5
+    )
+    clean = timeit.timeit(
+        lambda: [tokenizer.clean_words(x.split()) for x in corpus], number=5
+    )
+    streamed = timeit.timeit(
+        lambda: [list(tokenizer.iter_tokens(x)) for x in corpus], number=5
+    )
+    per_doc = lambda total: 1000000 * total / 5 / len(corpus)
+    print(f"{DESCRIPTIONS} descriptions of {config.MAX_DESCRIPTION_LENGTH} chars")
+    print(f"legacy clean_words:    {per_doc(legacy):8.1f} us/description")
+    print(f"tokenizer.clean_words: {per_doc(clean):8.1f} us/description")
+    print(f"tokenizer.iter_tokens: {per_doc(streamed):8.1f} us/description")
+
+
+if __name__ == "__main__":
+    main()
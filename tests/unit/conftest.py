@@ -0,0 +1,71 @@
+# the modules under test read their config at import, so storage is pointed
+# at a throwaway local folder before any of them is imported
+import os
+import sys
+import tempfile
+
+import pytest
+
+os.environ["FILE_SYSTEM_TYPE"] = "localfs"
+os.environ["LOCAL_BASE_FOLDER"] = tempfile.mkdtemp(prefix="myfundquest-test-")
+os.environ["ENABLE_SHARED_CACHE"] = "FALSE"
+os.environ["FEED_BACKEND"] = "file"
+os.environ["LOCK_BACKEND"] = "file"
+os.environ["INDEX_GENERATION_TTL_SECONDS"] = "0.05"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+import crud  # noqa: E402
+from crud import Crud  # noqa: E402
+from data_manager import DataManager  # noqa: E402
+from file_systems import LocalFileSystem  # noqa: E402
+import indexing  # noqa: E402
+from models import Campaign  # noqa: E402
+import reindex  # noqa: E402
+import tasks  # noqa: E402
+
+
+def build_campaign(**kwargs) -> Campaign:
+    # a valid campaign, kwargs override the defaults
+    return Campaign(
+        **dict(
+            dict(
+                title="Community garden",
+                description="Help us get it done",
+                user_id="user",
+                goal=100000,
+                category_id="1",
+                country_id=1,
+                currency_code="USD",
+                currency_symbol="$",
+                campaign_type_id=1,
+            ),
+            **kwargs,
+        )
+    )
+
+
+@pytest.fixture
+def datamgr(tmp_path, monkeypatch):
+    """a data manager over a folder of the test's own, the modules writing
+    through the shared one are pointed at it
+
+    modules that only write through it opt in with
+    pytestmark = pytest.mark.usefixtures("datamgr")
+    """
+    datamgr = DataManager(LocalFileSystem(), base_folder=str(tmp_path))
+    for module in [crud, indexing, reindex, tasks]:
+        monkeypatch.setattr(module, "datamgr", datamgr)
+    # the names are generated support data, not shipped with the repo
+    monkeypatch.setattr(Crud, "retrieve_first_names", classmethod(lambda cls: ["Sam"]))
+    return datamgr
+
+
+@pytest.fixture(autouse=True)
+def index_generation():
+    # the served generation is cached per process, tests swap data managers
+    from indexing import IndexGeneration
+
+    IndexGeneration.cache.clear()
+    yield
+    IndexGeneration.cache.clear()
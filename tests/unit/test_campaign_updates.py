@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import arrow
+import pytest
+
+from config import config
+from conftest import build_campaign
+from crud import Crud
+from indexing import IndexManager
+from models import Campaign
+from simulation import ContributionGenerator, populate_contributions
+import tasks
+from utils import date_to_string
+
+pytestmark = pytest.mark.usefixtures("datamgr")
+
+
+def test_concurrent_updates_are_kept():
+    campaign = build_campaign()
+    Crud.update_campaign(campaign)
+    # warm the cache, writers must not start from it
+    Crud.retrieve_campaign(campaign.id)
+
+    def donate(i: int):
+        with Crud.campaign_for_update(campaign.id) as stored:
+            stored.amount_reached += 10
+            stored.contribution_count += 1
+            Crud.update_campaign(stored)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(donate, range(20)))
+    stored = Crud.retrieve_campaign(campaign.id, use_cache=False)
+    assert (stored.amount_reached, stored.contribution_count) == (200, 20)
+
+
+def test_populate_from_a_stale_copy_continues_the_stored_campaign():
+    campaign = build_campaign(
+        last_contribution_datetime=date_to_string(arrow.utcnow().shift(days=-7))
+    )
+    Crud.update_campaign(campaign)
+    stale = Crud.retrieve_campaign(campaign.id)
+
+    fresh = stale.copy(deep=True)
+    assert populate_contributions(fresh)
+    stored = Crud.retrieve_campaign(campaign.id, use_cache=False)
+    assert stored.contribution_count > 0
+    # the copy passed in is updated to what was stored
+    assert fresh.contribution_count == stored.contribution_count
+
+    # the stored campaign is moved back to two days ago, the stale copy is
+    # still a week behind: only the two days due since the stored last
+    # contribution are added, the week isn't added again
+    with Crud.campaign_for_update(campaign.id) as stored:
+        stored.last_contribution_datetime = date_to_string(
+            arrow.utcnow().shift(days=-2)
+        )
+        Crud.update_campaign(stored)
+    populate_contributions(stale)
+    again = Crud.retrieve_campaign(campaign.id, use_cache=False)
+    assert (
+        again.contribution_count - stored.contribution_count < stored.contribution_count
+    )
+    last = arrow.get(stored.last_contribution_datetime)
+    added = again.contributions.count - stored.contributions.count
+    assert added > 0
+    assert all(arrow.get(x["date"]) > last for x in again.contributions.recent(added))
+
+
+def test_populate_counts_the_slots_beyond_the_ring_at_the_average():
+    campaign = build_campaign(
+        last_contribution_datetime=date_to_string(arrow.utcnow().shift(days=-7))
+    )
+    Crud.update_campaign(campaign)
+    generator = ContributionGenerator(
+        first_names=["Sam"], message_bank={}, donation_distribution=[10], seed=1
+    )
+    assert populate_contributions(campaign, generator=generator)
+    assert len(campaign.contributions) == config.CONTRIBUTION_RING_SIZE
+    assert campaign.contribution_count > config.CONTRIBUTION_RING_SIZE
+    assert campaign.amount_reached == 10 * campaign.contribution_count
+
+
+def test_active_campaigns_are_the_ones_below_goal():
+    below = build_campaign(goal=1000)
+    reached = build_campaign(goal=1000, amount_reached=1000)
+    for campaign in [below, reached]:
+        Crud.update_campaign(campaign)
+    assert list(IndexManager.iter_active_campaign_ids()) == [below.id]
+
+    with Crud.campaign_for_update(below.id) as stored:
+        stored.amount_reached = 1000
+        Crud.update_campaign(stored)
+    with Crud.campaign_for_update(reached.id) as stored:
+        stored.goal = 2000
+        Crud.update_campaign(stored)
+    assert list(IndexManager.iter_active_campaign_ids()) == [reached.id]
+
+    Crud.delete_campaign(reached.id)
+    assert list(IndexManager.iter_active_campaign_ids()) == []
+
+
+def test_advance_contributions_batches_the_active_campaigns(datamgr, monkeypatch):
+    monkeypatch.setattr(tasks, "datamgr", datamgr)
+    monkeypatch.setattr(config, "SIMULATION_BATCH_SIZE", 2)
+    queued = []
+    monkeypatch.setattr(
+        tasks.advance_contributions_batch,
+        "apply_async",
+        lambda kwargs, expires: queued.append(kwargs["campaign_ids"]),
+    )
+    campaigns = [build_campaign(goal=1000) for _ in range(3)]
+    for campaign in campaigns:
+        Crud.update_campaign(campaign)
+    Crud.update_campaign(build_campaign(goal=1000, amount_reached=1000))
+
+    assert tasks.advance_contributions() == 2
+    assert sorted(sum(queued, [])) == sorted([x.id for x in campaigns])
+
+    # a tick doesn't overlap the previous one
+    queued.clear()
+    with datamgr.lock(tasks.ADVANCE_CONTRIBUTIONS_LOCK_PATH):
+        assert tasks.advance_contributions() == 0
+    assert queued == []
+
+
+def test_the_active_marker_is_only_written_when_the_goal_is_crossed(monkeypatch):
+    campaign = build_campaign(goal=1000)
+    Crud.update_campaign(campaign)
+    paths = []
+    touch = IndexManager.touch
+
+    def recording_touch(path, *args, **kwargs):
+        paths.append(path)
+        touch(path, *args, **kwargs)
+
+    monkeypatch.setattr(IndexManager, "touch", staticmethod(recording_touch))
+    with Crud.campaign_for_update(campaign.id) as stored:
+        stored.amount_reached = 500
+        Crud.update_campaign(stored)
+    assert [x for x in paths if x.startswith("ActiveCampaignIndex")] == []
+    with Crud.campaign_for_update(campaign.id) as stored:
+        stored.amount_reached = 1000
+        Crud.update_campaign(stored)
+    assert list(IndexManager.iter_active_campaign_ids()) == []
+    with Crud.campaign_for_update(campaign.id) as stored:
+        stored.goal = 2000
+        Crud.update_campaign(stored)
+    assert [x for x in paths if x.startswith("ActiveCampaignIndex")] != []
+    assert list(IndexManager.iter_active_campaign_ids()) == [campaign.id]
+
+
+def test_save_and_loaddir_keep_the_state_apart(datamgr):
+    campaign = build_campaign()
+    Crud.update_campaign(campaign)
+    campaign.amount_reached = 500
+    campaign.contribution_count = 1
+    datamgr.save(campaign)
+
+    assert Crud.retrieve_campaign(campaign.id, use_cache=False).amount_reached == 500
+    assert "amount_reached" not in datamgr.read_document_or_none(
+        Campaign.build_path(campaign.id)
+    )
+    parent = Campaign.build_parent_path(campaign.id).rsplit("/", 1)[0]
+    (loaded,) = datamgr.loaddir(parent)
+    assert isinstance(loaded, Campaign)
+    assert (loaded.amount_reached, loaded.contribution_count) == (500, 1)
+
+
+def test_sentiment_of_a_deleted_campaign_is_skipped(monkeypatch):
+    assert tasks.get_campaign_sentiment("missing") is None
+
+    campaign = build_campaign()
+    Crud.update_campaign(campaign)
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def data(self):
+            return {"output": [{"label": "positive"}]}
+
+    def deleted_during_lookup(url):
+        Crud.delete_campaign(campaign.id)
+        return Response()
+
+    monkeypatch.setattr(tasks.requests, "get", deleted_during_lookup)
+    tasks.get_campaign_sentiment(campaign.id)
+    assert Crud.retrieve_campaign(campaign.id, use_cache=False) is None
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from indexing import IndexManager
+
+pytestmark = pytest.mark.usefixtures("datamgr")
+
+
+def test_counts_follow_membership():
+    IndexManager.update_categories({"1": {"a": 1.0, "b": 2.0}, "2": {"c": 3.0}})
+    assert IndexManager.retrieve_category_counts() == {"1": 2, "2": 1}
+
+    # repeated adds/removes don't skew the counts
+    IndexManager.update_categories({"1": {"a": 1.0}})
+    IndexManager.update_categories({"2": {"c": None}})
+    IndexManager.update_categories({"2": {"c": None}})
+    assert IndexManager.retrieve_category_counts() == {"1": 2, "2": 0}
+    assert IndexManager.retrieve_category_campaign_ids_page("1", limit=10) == (
+        ["b", "a"],
+        "",
+    )
+    assert IndexManager.retrieve_category_campaign_ids_page("2", limit=10) == ([], "")
+
+
+def test_concurrent_updates_are_counted():
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(
+            pool.map(
+                lambda i: IndexManager.update_categories({"1": {f"c{i}": float(i)}}),
+                range(60),
+            )
+        )
+        # the same campaign added concurrently is counted once
+        list(
+            pool.map(
+                lambda i: IndexManager.update_categories({"2": {"x": 1.0}}), range(8)
+            )
+        )
+    assert IndexManager.retrieve_category_counts() == {"1": 60, "2": 1}
@@ -0,0 +1,67 @@
+from models import ContributionRing
+
+
+def contribution(i: int, amount: int = 10, message: str = "") -> dict:
+    return dict(
+        name=f"donor{i}",
+        amount=amount,
+        date=f"2024-01-01T00:00:{i:02}+00:00",
+        message=message,
+    )
+
+
+def test_append_and_extend():
+    ring = ContributionRing(capacity=5)
+    ring.append(**contribution(0, message="hi"))
+    ring.extend(
+        names=["donor1", "donor2"],
+        amounts=[20, 30],
+        dates=[contribution(1)["date"], contribution(2)["date"]],
+        messages=["", "thanks"],
+    )
+    assert len(ring) == 3
+    assert [x["name"] for x in ring.recent()] == ["donor2", "donor1", "donor0"]
+    assert [x["name"] for x in ring.recent(2)] == ["donor2", "donor1"]
+    assert [x["message"] for x in ring.with_messages()] == ["thanks", "hi"]
+    assert [x["message"] for x in ring.with_messages(1)] == ["thanks"]
+
+
+def test_aggregates_cover_every_contribution():
+    ring = ContributionRing(capacity=2)
+    for i, amount in enumerate([10, 50, 20, 5]):
+        ring.append(**contribution(i, amount=amount))
+    assert (ring.count, ring.total) == (4, 85)
+    assert ring.top == contribution(1, amount=50)
+    assert ring.first == contribution(0, amount=10)
+    assert ring.last == contribution(3, amount=5)
+
+
+def test_capacity_keeps_the_newest():
+    ring = ContributionRing(capacity=3)
+    for i in range(7):
+        ring.append(**contribution(i))
+    assert len(ring) == 3
+    assert [x["name"] for x in ring.recent()] == ["donor6", "donor5", "donor4"]
+    assert ring.count == 7
+
+
+def test_from_list_orders_by_date():
+    contributions = [contribution(i, amount=i) for i in [2, 0, 1]]
+    # the legacy list kept contributions without a message key too
+    del contributions[0]["message"]
+    ring = ContributionRing.from_list(contributions)
+    assert [x["name"] for x in ring.recent()] == ["donor2", "donor1", "donor0"]
+    assert ring.first["name"] == "donor0"
+    assert ring.last == contribution(2, amount=2)
+
+
+def test_from_storage():
+    ring = ContributionRing(capacity=3)
+    for i in range(4):
+        ring.append(**contribution(i))
+    stored = ContributionRing.from_storage(ring.dict())
+    assert stored == ring
+    assert stored.recent() == ring.recent()
+    # campaigns stored before the ring
+    legacy = ContributionRing.from_storage([contribution(0), contribution(1)])
+    assert [x["name"] for x in legacy.recent()] == ["donor1", "donor0"]
@@ -0,0 +1,20 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from data_manager import DataManager
+from file_systems import LocalFileSystem
+
+
+async def running_loop() -> asyncio.AbstractEventLoop:
+    return asyncio.get_running_loop()
+
+
+def test_run_reuses_the_event_loop(tmp_path):
+    datamgr = DataManager(LocalFileSystem(), base_folder=str(tmp_path))
+    datamgr.write_document("a.json", {"x": 1})
+    assert datamgr.run(datamgr.aexists("a.json"))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        loops = list(pool.map(lambda _: datamgr.run(running_loop()), range(8)))
+    # a scoped data manager shares it too
+    loops.append(datamgr.scoped("b").run(running_loop()))
+    assert len(set(loops)) == 1
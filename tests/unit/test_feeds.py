@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from data_manager import LoadOjbectException
+from feeds import (
+    FileCounters,
+    FileFeed,
+    FileLeaderboard,
+    InvalidFeedCursorException,
+    RedisFeed,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+class SortedSet:
+    """the sorted set reads of redis a RedisFeed uses, over one key"""
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def _rows(self):
+        rows = sorted(((y, x.encode()) for x, y in self.scores.items()), reverse=True)
+        return [(x, y) for y, x in rows]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        return self._rows()[start : end + 1]
+
+    def zrevrangebyscore(self, key, max, min, start, num, withscores=False):
+        rows = [x for x in self._rows() if min == "-inf" or x[1] >= min]
+        return [x for x in rows if x[1] <= max][start : start + num]
+
+
+def test_cursor_round_trip():
+    for entry in [(1700000000.123456, "abc"), (0.1, "with_underscore"), (-2.5, "")]:
+        assert decode_cursor(encode_cursor(entry)) == entry
+
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidFeedCursorException):
+        decode_cursor("not-a-score_abc")
+
+
+def test_pages_newest_first(datamgr):
+    feed = FileFeed("test", capacity=10, datamgr=datamgr)
+    for i in range(7):
+        assert feed.append(f"c{i}", score=float(i))
+    assert not feed.append("c3", score=3.0)
+
+    ids, cursor = feed.page(3)
+    assert ids == ["c6", "c5", "c4"]
+    ids, cursor = feed.page(3, cursor=cursor)
+    assert ids == ["c3", "c2", "c1"]
+    ids, cursor = feed.page(3, cursor=cursor)
+    assert ids == ["c0"] and cursor == ""
+
+
+def test_capacity_keeps_newest(datamgr):
+    feed = FileFeed("test", capacity=3, datamgr=datamgr)
+    for i in range(5):
+        feed.append(f"c{i}", score=float(i))
+    assert [x[1] for x in feed.read(10)] == ["c4", "c3", "c2"]
+    # older than everything kept
+    assert not feed.append("old", score=-1.0)
+    # out of order, but newer than the oldest kept
+    assert feed.append("late", score=2.5)
+    assert [x[1] for x in feed.read(10)] == ["c4", "c3", "late"]
+
+
+def test_remove(datamgr):
+    feed = FileFeed("test", capacity=5, datamgr=datamgr)
+    for i in range(3):
+        feed.append(f"c{i}", score=float(i))
+    assert feed.remove("c1")
+    assert not feed.remove("c1")
+    assert feed.count() == 2
+    assert feed.page(5) == (["c2", "c0"], "")
+
+
+def test_concurrent_appends_are_kept(datamgr):
+    feed = FileFeed("test", capacity=100, datamgr=datamgr)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        assert all(pool.map(lambda i: feed.append(f"c{i}", float(i)), range(60)))
+    assert feed.count() == 60
+    assert [x[1] for x in feed.read(3)] == ["c59", "c58", "c57"]
+
+
+def test_concurrent_leaderboard_updates_are_kept(datamgr):
+    board = FileLeaderboard("test", capacity=100, datamgr=datamgr)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda i: board.update({f"c{i}": float(i)}), range(60)))
+    entries = board.read(100)
+    assert len(entries) == 60
+    assert entries[0] == (59.0, "c59")
+
+
+def test_reads_during_writes_see_whole_documents(datamgr):
+    board = FileLeaderboard("test", capacity=500, datamgr=datamgr)
+
+    def write(i: int):
+        board.update({f"c{i}": float(i)})
+
+    def read(i: int) -> int:
+        return len(board.read(500))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        writes = pool.map(write, range(200))
+        counts = list(pool.map(read, range(400)))
+        list(writes)
+    # each read saw some complete version of the board, none raised
+    assert all(0 <= x <= 200 for x in counts)
+    assert len(board.read(500)) == 200
+    assert [x for x in datamgr.ls("Leaderboard") if x.endswith(".put")] == []
+
+
+def test_a_document_that_fails_to_decode_is_read_again(datamgr, monkeypatch):
+    counters = FileCounters("test", datamgr=datamgr)
+    counters.incr({"1": 2})
+    read = datamgr.read_document_or_none
+    calls = []
+
+    def torn_once(path, use_cache=True):
+        calls.append(use_cache)
+        if len(calls) == 1:
+            raise LoadOjbectException("torn")
+        return read(path, use_cache=use_cache)
+
+    monkeypatch.setattr(datamgr, "read_document_or_none", torn_once)
+    assert counters.read() == {"1": 2}
+    assert calls == [True, False]
+
+
+def test_leaderboard_updates_that_change_nothing_take_no_lock(datamgr, monkeypatch):
+    board = FileLeaderboard("test", capacity=3, datamgr=datamgr)
+    board.update({"a": 3.0, "b": 2.0, "c": 1.0})
+
+    def no_lock(*args, **kwargs):
+        raise AssertionError("locked")
+
+    monkeypatch.setattr(datamgr, "lock", no_lock)
+    # off the board and scoring below it, or removing an id it doesn't hold
+    board.update({"d": 0.5, "e": None})
+    monkeypatch.undo()
+
+    board.update({"d": 1.5})
+    assert board.read(3) == [(3.0, "a"), (2.0, "b"), (1.5, "d")]
+
+
+def test_redis_pages_through_ties_on_the_score():
+    scores = {f"c{i:03}": 1.0 for i in range(150)}
+    scores.update(older=0.5)
+    feed = RedisFeed("test", capacity=200, redis=SortedSet(scores))
+
+    ids, cursor = feed.page(2)
+    assert ids == ["c149", "c148"]
+    seen = list(ids)
+    while cursor:
+        ids, cursor = feed.page(2, cursor=cursor)
+        seen.extend(ids)
+    assert seen == sorted(scores, key=lambda x: (scores[x], x), reverse=True)
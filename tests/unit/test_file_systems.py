@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from data_manager import DataManager, sep
+from file_systems import LocalFileSystem
+from file_systems.weed import WeedFileSystem
+
+
+def test_local_rm_if_exists_removes_a_folder_with_its_content(tmp_path):
+    datamgr = DataManager(LocalFileSystem(), base_folder=str(tmp_path))
+    datamgr.write_document(sep.join(["Reindex", "gen", "runs", "a.json"]), {})
+    assert datamgr.rm_if_exists(sep.join(["Reindex", "gen"]))
+    assert not datamgr.exists(sep.join(["Reindex", "gen"]))
+    assert not datamgr.rm_if_exists(sep.join(["Reindex", "gen"]))
+
+
+class FilerSession:
+    # records the DELETEs sent to the filer, a folder with entries is only
+    # deleted when the request is recursive
+    def __init__(self, folders):
+        self.folders = folders
+        self.urls = []
+
+    def delete(self, url, timeout=None):
+        self.urls.append(url)
+        path, _, query = url.partition("?")
+        if path not in self.folders:
+            return SimpleNamespace(ok=False, status_code=404)
+        if "recursive=true" not in query:
+            return SimpleNamespace(ok=False, status_code=500)
+        self.folders.remove(path)
+        return SimpleNamespace(ok=True, status_code=204)
+
+
+def test_weed_rm_if_exists_removes_a_folder_with_its_content():
+    fs = WeedFileSystem(url_base="http://filer:8888")
+    session = FilerSession({"http://filer:8888/data/Reindex/gen"})
+    fs.wf._local.session = session
+    assert fs.rm_if_exists("/data/Reindex/gen")
+    assert not fs.rm_if_exists("/data/Reindex/gen")
+    assert session.urls[0] == "http://filer:8888/data/Reindex/gen?recursive=true"
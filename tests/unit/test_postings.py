@@ -0,0 +1,45 @@
+from postings import MAX_SHARED_PREFIX, PostingList
+
+
+def test_encode_decode_round_trip():
+    postings = PostingList(
+        ["campaign-b", "campaign-a", "other", "campaign-a"],
+        frequencies={"campaign-b": 3, "other": 1},
+    )
+    encoded = postings.encode()
+    assert encoded == "0campaign-a 9b:3 0other"
+    decoded = PostingList.decode(encoded)
+    assert decoded.ids == ["campaign-a", "campaign-b", "other"]
+    assert decoded.frequencies == {"campaign-b": 3}
+    assert decoded.encode() == encoded
+
+
+def test_decode_empty():
+    assert len(PostingList.decode("")) == 0
+    assert PostingList().encode() == ""
+
+
+def test_shared_prefix_is_capped():
+    prefix = "x" * (MAX_SHARED_PREFIX + 10)
+    postings = PostingList([prefix + "1", prefix + "2"])
+    decoded = PostingList.decode(postings.encode())
+    assert decoded.ids == [prefix + "1", prefix + "2"]
+
+
+def test_add_keeps_ids_sorted_and_reports_changes():
+    postings = PostingList(["b", "d"])
+    assert postings.add("c", "a")
+    assert postings.ids == ["a", "b", "c", "d"]
+    assert not postings.add("a")
+    assert postings.add("a", frequency=4)
+    assert postings.frequency("a") == 4
+    assert postings.add("a")
+    assert postings.frequency("a") == 1 and "a" not in postings.frequencies
+
+
+def test_remove():
+    postings = PostingList(["a", "b", "c"], frequencies={"b": 2})
+    assert postings.remove("b", "missing")
+    assert postings.ids == ["a", "c"]
+    assert "b" not in postings and postings.frequency("b") == 1
+    assert not postings.remove("b")
@@ -0,0 +1,73 @@
+import pytest
+
+from config import config
+from conftest import build_campaign
+from crud import Crud
+from data_manager import sep
+from indexing import IndexGeneration, IndexManager, IndexWriteBatch, SearchEngine
+import reindex
+import tasks
+
+pytestmark = pytest.mark.usefixtures("datamgr")
+
+
+def test_reindex_builds_a_fresh_generation(datamgr):
+    campaigns = [
+        build_campaign(title="Community garden", user_id="user0"),
+        build_campaign(title="Garden tools", user_id="user1"),
+        build_campaign(title="School trip", user_id="user0", category_id="2"),
+    ]
+    for campaign in campaigns:
+        Crud.update_campaign(campaign)
+    # stale entries, eg: left behind by a failed write
+    with IndexWriteBatch() as batch:
+        batch.add_words("gone", {"garden": 1})
+        batch.add_category("1", "gone")
+        batch.add_latest("gone")
+    assert "gone" in SearchEngine.search(["garden"])[0]
+
+    old = IndexGeneration.current()
+    reindex.reindex(local=True)
+    generation = IndexGeneration.current()
+    assert generation != old
+    assert IndexGeneration.read(use_cache=False)["building"] == ""
+
+    ids = [x.id for x in campaigns]
+    assert sorted(SearchEngine.search(["garden"])[0]) == sorted(ids[0:2])
+    assert IndexManager.retrieve_category_counts() == {"1": 2, "2": 1}
+    latest, _ = IndexManager.retrieve_latest_campaign_ids_page(10)
+    assert sorted(latest) == sorted(ids)
+    assert sorted(IndexManager.retrieve_campaign_ids_by_user_id("user0")) == sorted(
+        [ids[0], ids[2]]
+    )
+    assert not datamgr.exists(sep.join(["Reindex", generation]))
+
+    # writes after the swap land in the served generation
+    Crud.update_campaign(
+        build_campaign(title="Garden party", user_id="user1", category_id="2")
+    )
+    assert len(SearchEngine.search(["garden"])[0]) == 3
+
+    IndexManager.drop_generation(old)
+    assert len(SearchEngine.search(["garden"])[0]) == 3
+
+
+def test_live_edits_during_a_build_win_over_the_runs():
+    campaign = build_campaign(title="Gnome garden")
+    Crud.update_campaign(campaign)
+    old = IndexGeneration.current()
+    generation = "build-live-edits"
+    IndexGeneration.start_build(generation)
+    # the batch reads the campaign before the edit
+    tasks.reindex_campaigns([campaign.id], generation=generation, run="0")
+
+    with Crud.campaign_for_update(campaign.id) as stored:
+        stored.title = "Gnome school"
+        Crud.update_campaign(stored)
+
+    for bucket in range(config.REINDEX_WORD_BUCKETS):
+        tasks.merge_word_bucket(generation=generation, bucket=bucket)
+    IndexGeneration.swap(generation)
+    assert campaign.id not in SearchEngine.search(["gnome", "garden"])[0]
+    assert SearchEngine.search(["gnome", "school"])[0] == [campaign.id]
+    IndexManager.drop_generation(old)
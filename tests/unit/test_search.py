@@ -0,0 +1,42 @@
+import pytest
+
+from indexing import IndexWriteBatch, SearchEngine
+
+pytestmark = pytest.mark.usefixtures("datamgr")
+
+
+def index(words_by_campaign):
+    with IndexWriteBatch() as batch:
+        for campaign_id, words in words_by_campaign.items():
+            batch.add_words(campaign_id, words)
+
+
+def test_ranking_and_paging():
+    index(
+        {
+            "a": {"garden": 1},
+            "b": {"garden": 3, "school": 1},
+            "c": {"garden": 1, "school": 2},
+            "d": {"school": 1},
+            "e": {"garden": 2},
+        }
+    )
+    ids, cursor = SearchEngine.search(["garden", "school"], mode="or", page_size=2)
+    assert ids == ["b", "c"]
+    ids, cursor = SearchEngine.search(
+        ["garden", "school"], mode="or", page_size=2, cursor=cursor
+    )
+    assert ids == ["e", "a"]
+    ids, cursor = SearchEngine.search(
+        ["garden", "school"], mode="or", page_size=2, cursor=cursor
+    )
+    assert ids == ["d"] and cursor == ""
+
+    assert SearchEngine.search(["garden", "school"], mode="and") == (["b", "c"], "")
+
+
+def test_removed_words_no_longer_match():
+    index({"a": {"garden": 1}, "b": {"garden": 1}})
+    with IndexWriteBatch() as batch:
+        batch.remove_words("a", ["garden"])
+    assert SearchEngine.search(["garden"]) == (["b"], "")